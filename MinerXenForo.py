@@ -3,6 +3,8 @@ from urllib.parse import urlparse
 import os
 import json
 import requests
+from requests.adapters import HTTPAdapter
+import urllib3
 from bs4 import BeautifulSoup
 from datetime import datetime
 import dateutil
@@ -11,9 +13,26 @@ import random
 import time
 import logging
 import urllib.parse
-import pytz
 import sys
 import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import parsers
+from scheduler import Scheduler
+from rate_limiter import RateLimiter, RetryableHTTPError, RETRY_STATUS
+from concurrency import AIMDController, RequestSlot
+from page_cache import PageCache, conditional_headers
+from thread_store import ThreadStore
+from id_allocator import IdAllocator
+from catalog import Catalog
+from frontier import Frontier
+from serializer import Serializer, write_atomic
+from metrics import Metrics, Reporter
+
+ENGINES_MAX_REQUEST = { # upper limit of -mr for each engine
+    'thread': 100, # one OS thread per request
+    'async': 1000, # coroutines, threads are not created per request
+}
 
 def default(o): # to save custom format in json
     if type(o) is datetime:
@@ -21,74 +40,220 @@ def default(o): # to save custom format in json
 
 class Base:
 
-    def __init__(self, cache_pages):
+    def __init__(self, cache_pages, max_request=1, pool_connections=10, pool_maxsize=None, timeout=(10, 60), rate_limit=None, rate_burst=1, max_retries=3, autotune_floor=None, cache_revalidate=False, cache_max_size=None, parser="html.parser", parse_workers=0, fan_out=1):
         self.cache_pages = cache_pages
+        self.parser = parser # see parsers.BACKENDS
+        self.metrics = Metrics() # shared by every worker and engine
+
+        self.parse_pool = None # pages are parsed by the thread that downloaded them
+        if parse_workers>0: # download threads only wait while other processes parse (no GIL contention)
+            self.parse_pool = ProcessPoolExecutor(parse_workers, mp_context=multiprocessing.get_context("spawn"))
+        self.cache_max_size = cache_max_size # bytes. Least recently used pages are evicted above it
+        self.cache_revalidate = cache_revalidate # refetch cached pages with If-None-Match/If-Modified-Since
+        self.page_cache = None
         self.base_header = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/90.0.4430.93 Safari/537.36'
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/90.0.4430.93 Safari/537.36',
+            'Accept-Encoding': urllib3.util.make_headers(accept_encoding=True)['accept-encoding'], # gzip/deflate, plus br when brotli is installed
         }
+
+        self.timeout = timeout # (connect, read) in seconds
+        self.pool_connections = pool_connections # amount of hosts kept in the pool
+        self.pool_maxsize = pool_maxsize
+        if self.pool_maxsize==None:
+            self.pool_maxsize = max_request # one keep-alive connection per simultaneous request
+
+        # a single adapter shared by every thread. Each thread has its own session (cookies) on top of it
+        self.http_adapter = HTTPAdapter(pool_connections=self.pool_connections, pool_maxsize=self.pool_maxsize, pool_block=True)
+        self.sessions = threading.local()
+
+        self.max_retries = max_retries
+        self.rate_limiter = RateLimiter(rate_limit, rate_burst) # shared by every worker
+
+        self.concurrency = None # requests in flight are only limited by the amount of workers
+        if autotune_floor!=None:
+            self.concurrency = AIMDController(autotune_floor, max_request) # workers wait for a slot
+
+        self.fan_out = max(1, fan_out) # pages of one thread or listing requested together
+        self.fan_out_pool = None
+        if self.fan_out>1:
+            self.fan_out_pool = ThreadPoolExecutor(max_request, thread_name_prefix="fanout")
+            if self.concurrency==None: # fan-out requests are not bounded by the workers. Keep max_request in flight
+                self.concurrency = AIMDController(max_request, max_request)
+
         logging.info("Class Base created")
 
+    def get_session(self):
+        session = getattr(self.sessions, 'session', None)
+        if session==None:
+            session = requests.Session()
+            session.headers.update(self.base_header)
+            session.mount("http://", self.http_adapter)
+            session.mount("https://", self.http_adapter)
+            self.sessions.session = session
+        return session
+
+    def log_connection_stats(self):
+        pools = self.http_adapter.poolmanager.pools
+        for key in pools.keys():
+            try:
+                pool = pools[key]
+            except KeyError: # pool discarded meanwhile
+                continue
+            logging.info("Connection pool {}://{} requests: {} connections opened: {} reused: {}".format(pool.scheme, pool.host, pool.num_requests, pool.num_connections, pool.num_requests-pool.num_connections))
+
     def warm_up(self):
-        logging.info("Warming up Base with cache: {}".format(self.cache_pages))
+        logging.info("Warming up Base with cache: {} revalidate: {}".format(self.cache_pages, self.cache_revalidate))
         if self.cache_pages:
             self.cache_html_location = self.config_folder+"cache_html/"
             logging.info("Cache location: {}".format(self.cache_html_location))
-            if not os.path.exists(self.cache_html_location): # create config folder
-                os.makedirs(self.cache_html_location)
+            self.page_cache = PageCache(self.cache_html_location, self.cache_max_size)
 
-    def get_html_protected(self, url): # get html with cache
-        logging.info("Will request URL: {}".format(url))
+    def cache_read(self, url): # (cached content, validators). content is None on cache miss
+        if not self.cache_pages:
+            return None, {}
+        return self.page_cache.get(url)
 
-        file_name = None
-        do_request = True
-        cache_hit = False
-        if self.cache_pages: # if cache is enable try to load last request
-            file_name = self.cache_html_location+url.replace(self.domain,"").replace("/","").replace(":","")+".html"
-            if os.path.isfile(file_name):
-                logging.info("Cache HIT URL: {}".format(url))
-                do_request = False
-                cache_hit = True
-                f = open(file_name, "r")
-                content = f.read()
-                f.close()
-
-        if do_request: # load url from web
-            logging.info("Requesting URL: {}".format(url))
-            req = requests.get(url, headers=self.base_header)
-            content = req.text
-
-        if self.cache_pages and not cache_hit: # if cache is enable save result
+    def cache_write(self, url, content, headers):
+        if self.cache_pages: # if cache is enable save result
             logging.info("Saving cache URL: {}".format(url))
-            f = open(file_name, "w")
-            f.write(content)
-            f.close()
+            self.page_cache.put(url, content, headers)
 
+    def parse_html(self, content, url): # whole document as bs4
+        backend = self.parser
+        if backend=="lexbor": # pages that are not extracted by parsers.py still need bs4
+            backend = "html.parser"
         try:
-            res = BeautifulSoup(content, "html.parser")
-            return res
+            return BeautifulSoup(content, backend)
         except:
             logging.error("ERROR parsing url with bs4: {}".format(url))
             return None
 
-    def get_html(self, url): # retry controll from get html
-        limit_error = 0
-        while limit_error<3:
-            limit_error += 1
+    def get_content_protected(self, url): # get html text with cache
+        logging.info("Will request URL: {}".format(url))
+
+        cached, validators = self.cache_read(url)
+        if cached!=None and not self.cache_revalidate:
+            logging.info("Cache HIT URL: {}".format(url))
+            self.metrics.inc('cache_total', result="hit")
+            return cached
+        if self.cache_pages and cached==None:
+            self.metrics.inc('cache_total', result="miss")
+
+        headers = {}
+        if cached!=None:
+            headers = conditional_headers(validators)
+
+        self.rate_limiter.acquire(url)
+        with RequestSlot(self.concurrency):
+            logging.info("Requesting URL: {}".format(url))
+            self.metrics.add('in_flight', 1)
+            started = time.time()
             try:
-                return self.get_html_protected(url)
+                req = self.get_session().get(url, headers=headers, timeout=self.timeout)
+            except Exception:
+                self.metrics.inc('requests_total', status="error")
+                raise
+            finally:
+                self.metrics.observe('request_seconds', time.time()-started)
+                self.metrics.add('in_flight', -1)
+            self.metrics.inc('requests_total', status=str(req.status_code))
+            self.metrics.inc('bytes_received_total', req.raw.tell()) # as received, before decompression. The body was already read
+            if req.status_code in RETRY_STATUS:
+                raise RetryableHTTPError(url, req.status_code, req.headers.get('Retry-After'))
+
+            if req.status_code==304 and cached!=None: # not modified since cached
+                logging.info("Cache HIT (revalidated) URL: {}".format(url))
+                self.metrics.inc('cache_total', result="revalidated")
+                content = cached
+            else:
+                content = req.text
+                self.cache_write(url, content, req.headers)
+
+        return content
+
+    def get_content(self, url): # retry controll from get html
+        attempt = 0
+        while attempt<self.max_retries:
+            attempt += 1
+            try:
+                return self.get_content_protected(url)
+            except RetryableHTTPError as e:
+                logging.error("ERROR getting HTML: {}".format(e))
+                cause = str(e.status)
+                delay = self.rate_limiter.backoff(url, attempt, e.status, e.retry_after)
             except Exception as e:
                 logging.error("ERROR getting HTML: {}".format(e))
-                time.sleep(5+limit_error*30) # sleep for 5, 35, 65...
-        
+                cause = type(e).__name__
+                delay = self.rate_limiter.backoff(url, attempt)
+
+            if attempt<self.max_retries:
+                self.metrics.inc('retries_total', cause=cause)
+                time.sleep(delay)
+
+        self.metrics.inc('failures_total')
         return None
 
+    def get_html(self, url):
+        content = self.get_content(url)
+        if content==None:
+            return None
+        return self.parse_html(content, url)
+
+    def parse_page(self, kind, content, url): # information of a page kind (see parsers.EXTRACTORS)
+        started = time.time()
+        if self.parse_pool!=None:
+            page = self.parse_pool.submit(parsers.parse_page, kind, content, self.base_url, self.parser).result()
+        else:
+            page = parsers.parse_page(kind, content, self.base_url, self.parser)
+        self.record_parse(kind, started)
+        return page
+
+    def record_parse(self, kind, started):
+        self.metrics.observe('parse_seconds', time.time()-started, kind=kind)
+        self.metrics.inc('pages_total', kind=kind)
+
+    def close(self):
+        if self.fan_out_pool!=None:
+            self.fan_out_pool.shutdown()
+            self.fan_out_pool = None
+        if self.parse_pool!=None:
+            self.parse_pool.shutdown()
+            self.parse_pool = None
+
+    def get_page(self, kind, url):
+        content = self.get_content(url)
+        if content==None:
+            return None
+        return self.parse_page(kind, content, url)
+
+    def get_pages(self, requests): # list of (kind, url) -> list of pages, downloaded together
+        if self.fan_out_pool==None:
+            return [self.get_page(*r) for r in requests]
+        return list(self.fan_out_pool.map(lambda r: self.get_page(*r), requests))
+
+    def run_steps(self, steps): # drive a *_steps generator answering every (kind, url), or list of them, it yields
+        try:
+            request = next(steps)
+            while True:
+                try:
+                    if type(request) is list:
+                        page = self.get_pages(request)
+                    else:
+                        page = self.get_page(*request)
+                except Exception as e: # raised where the generator asked for the page, so it saves what it has
+                    request = steps.throw(e)
+                    continue
+                request = steps.send(page)
+        except StopIteration as stop:
+            return stop.value
+
 
 class Manager(Base):
 
-    def __init__(self, base_url, max_request, cache_pages=False):
+    def __init__(self, base_url, max_request, cache_pages=False, pool_connections=10, pool_maxsize=None, timeout=(10, 60), engine="thread", rate_limit=None, rate_burst=1, max_retries=3, autotune_floor=None, cache_revalidate=False, cache_max_size=None, parser="html.parser", parse_workers=0, force=False, fan_out=1, fresh=False, serializer="json", metrics_interval=10):
         logging.info("Creating manager")
 
-        super().__init__(cache_pages)
+        super().__init__(cache_pages, max_request, pool_connections, pool_maxsize, timeout, rate_limit, rate_burst, max_retries, autotune_floor, cache_revalidate, cache_max_size, parser, parse_workers, fan_out)
         self.base_url = base_url
         if self.base_url[-1]=="/":
             self.base_url = self.base_url[0:-1] # remove "/" from the url to allow concatenation
@@ -98,43 +263,49 @@ class Manager(Base):
         self.threads_folder = None
         self.config_file = None
 
-        self.threads = []
-        self.threads_href = {}
+        self.serializer = Serializer(serializer) # format of category and thread files
+        self.catalog = None # created with the config folder
+        self.frontier = None
+        self.fresh = fresh # do not resume the interrupted run
+        self.resume = False # an interrupted run is being resumed
+        self.force = force # reload posts of every thread, even the unchanged ones
+        self.metrics_interval = metrics_interval # seconds between metrics reports. 0 disables them
+        self.reporter = None
+        self.phase = None # frontier phase running, shown in the progress line
+
 
+        self.engine = engine
+        if not self.engine in ENGINES_MAX_REQUEST:
+            raise Exception("Invalid engine parameter")
 
         self.max_request = max_request
-        if self.max_request <1 or self.max_request > 100:
+        if self.max_request <1 or self.max_request > ENGINES_MAX_REQUEST[self.engine]:
             raise Exception("Invalid max_request parameter")
 
 
 
-        self.id_counter = 0
-        #locks
-        self.lock_new_id = threading.Lock()
+        self.id_allocator = None # created with the config file
 
 
 
 
         self.warm_up() # must be last, but before create_config
-        self.create_configs() # depends on warm_up and locks
+        self.create_configs() # depends on warm_up
 
         logging.info("Manager created")
 
-    def get_new_id(self):
-        self.lock_new_id.acquire()
-        v = self.id_counter
-        self.id_counter += 1
-
-        config_file = self.config_folder+"config.json" # define config file
-        f = open(config_file, 'r')
-        data = json.loads(f.read())
-        f.close()
-        data['last_id'] = self.id_counter
-
-        self.write_json(config_file, data)
+    def close(self):
+        self.stop_reporter()
+        super().close()
+        if self.catalog!=None:
+            self.catalog.close()
+            self.catalog = None
+        if self.frontier!=None:
+            self.frontier.close()
+            self.frontier = None
 
-        self.lock_new_id.release()
-        return v
+    def get_new_id(self):
+        return self.id_allocator.get()
 
     def create_configs(self):
         logging.info("Creating configs")
@@ -156,6 +327,16 @@ class Manager(Base):
         if not os.path.exists(self.threads_folder): # create threads folder
             logging.info("Creating folder: {}".format(self.threads_folder))
             os.makedirs(self.threads_folder)
+        self.thread_store = ThreadStore(self.threads_folder, self.serializer)
+        self.catalog = Catalog(self.config_folder+"catalog.sqlite")
+
+        self.frontier = Frontier(self.config_folder+"frontier.sqlite")
+        self.resume = not self.fresh and self.frontier.has_unfinished_run()
+        if self.resume:
+            logging.info("Resuming the interrupted run")
+        else:
+            self.frontier.discard()
+        self.frontier.open_run(self.resume)
 
         self.config_file = self.config_folder+"config.json" # define config file
         logging.info("Config file defined as: {}".format(self.config_file))
@@ -163,11 +344,6 @@ class Manager(Base):
 
         if os.path.isfile(self.config_file): # create config folder
             logging.info("Reading config file")
-            f = open(self.config_file, "r")
-            data = json.loads(f.read())
-            f.close()
-
-            self.id_counter = data['last_id']
 
         else:
             logging.info("Creating file defined as: {}".format(self.config_file))
@@ -178,9 +354,32 @@ class Manager(Base):
             }
             self.write_json(self.config_file, data)
 
+        self.id_allocator = IdAllocator(self.config_file)
 
         self.get_categories() # auto load das categorias
 
+        if self.catalog.is_empty(): # first run, or files written before the catalog existed
+            self.build_catalog()
+
+    def build_catalog(self): # index the categories_threads/ and threads/ files
+        logging.info("Building catalog from {}".format(self.categories_folder))
+
+        for file in os.listdir(self.categories_folder):
+            base = self.serializer.base_name(file)
+            if base==None:
+                continue
+            dat = self.serializer.read(self.categories_folder+base)
+            self.catalog.put_threads(dat['threads'], self.threads_folder, self.serializer.format.document_ext)
+            self.catalog.put_subcategory(dat, self.categories_folder+file)
+
+        for thread_id in self.thread_store.list_ids():
+            try:
+                self.catalog.put_mined(int(thread_id), self.thread_store.load_header(thread_id))
+            except Exception as e:
+                logging.warning("Thread file not added to the catalog {}: {}".format(thread_id, e))
+
+        logging.info("Catalog built: {}".format(self.catalog.summary()))
+
     def get_categories(self):
         logging.info("Getting categories")
 
@@ -321,10 +520,14 @@ class Manager(Base):
         logging.info("Categories loaded completed")
 
     def get_threads_page(self, cat_id, sub_id, url):
+        return self.run_steps(self.get_threads_page_steps(cat_id, sub_id, url))
+
+    def get_threads_page_steps(self, cat_id, sub_id, url, task=None): # generator. Yields (kind, url) and receives the extracted page. task: frontier task
         logging.info("getthreadspage Starting: {} {} {}".format(cat_id, sub_id, url))
         initial_url = ""+url
 
-        dst_file = self.categories_folder+"category_{}_subcategory_{}.json".format(cat_id, sub_id)
+        dst_base = self.categories_folder+"category_{}_subcategory_{}".format(cat_id, sub_id)
+        dst_file = self.serializer.document_file(dst_base)
         logging.info("getthreadspage file: {}".format(dst_file))
 
 
@@ -337,11 +540,10 @@ class Manager(Base):
 
         res = {}
         create_file = True
-        if os.path.isfile(dst_file):
+        if self.serializer.exists(dst_base):
             try:
                 logging.info("getthreadspage file exist! {}".format(dst_file))
-                with open(dst_file, "r") as f:
-                    res = json.loads(f.read())
+                res = self.serializer.read(dst_base)
 
                 page = res['total_pages']
                 total_threads = res['total_threads']
@@ -362,7 +564,8 @@ class Manager(Base):
                 'total_threads': 0,
             }
 
-            self.write_json(dst_file, res)
+            self.serializer.write(dst_base, res)
+            self.catalog.put_subcategory(res, dst_file)
 
 
         logging.info("len(res['threads'])>0 {}".format(len(res['threads'])>0))
@@ -374,25 +577,20 @@ class Manager(Base):
                 try:
                     t = datetime.fromisoformat(t)
                 except:
-                    t = t[0:-2]+":"+t[-2:]
-                    t = datetime.fromisoformat(t)
+                    t = parsers.parse_datetime(t)
                 time_stop_thread = t
             except:
                 logging.info("Using datetime.min as time_stop_thread")
-                time_stop_thread = datetime.min
-                time_stop_thread = time_stop_thread.replace(tzinfo=pytz.timezone('America/Sao_Paulo'))
+                time_stop_thread = parsers.min_datetime()
         else:
             logging.info("No thread. Using datetime.min as time_stop_thread ")
-            time_stop_thread = datetime.min
-            time_stop_thread = time_stop_thread.replace(tzinfo=pytz.timezone('America/Sao_Paulo'))
+            time_stop_thread = parsers.min_datetime()
 
 
         logging.info("Checking for neweset message in threads ")
         try:
             for i in range(len(res['threads'])):
-                t = res['threads'][i]['last_post']
-                t = t[0:-2]+":"+t[-2:]
-                t = datetime.fromisoformat(t)
+                t = parsers.parse_datetime(res['threads'][i]['last_post'])
                 if t>time_stop_thread:
                     time_stop_thread = t
         except KeyError as ke:
@@ -400,234 +598,274 @@ class Manager(Base):
             pass
 
 
-        reach_oldest_record = False
-
-
-        while True:
-            html = self.get_html(url)
-            if html==None:
-                logging.error("html returned None. Operation stopped. (2) {}".format(url))
-                break
-
-            try:
-                res['total_pages'] = int(html.find("ul", class_="pageNav-main").find_all('li')[-1].text)
-            except:
-                res['total_pages'] = 1
-
-            posts = html.find_all("div", class_="structItem-title")
-
-
-            for post in posts:
+        index_href = {} # href -> position in res['threads']
+        for i in range(len(res['threads'])):
+            if not res['threads'][i]['href'] in index_href:
+                index_href[res['threads'][i]['href']] = i
 
 
-                is_fixed = "structItemContainer-group--sticky" in post.parent.parent.parent['class']
-                href = ""
-                user_el = post.parent.find('div', class_='structItem-minor').li.a
-                member_href = ""
-                member_name = ""
-                try:
-                    member_href = user_el['href']
-                    member_href = urllib.parse.urljoin(self.base_url, member_href)
-                    member_name = user_el.text
-                except:
-                    pass
-                date_thread = post.parent.parent.find('time')['datetime']
+        reach_oldest_record = False
 
-                tags_a = post.find_all('a')
-                tags_thread = []
+        page = 1 # page of url
+        total_pages = 1
+        prefetched = {} # url -> listing page downloaded ahead by fan-out
 
-                title = tags_a[-1].text
-                href = urllib.parse.urljoin(self.base_url, tags_a[-1]['href'])
+        if task!=None and task['state']!=None: # the interrupted run already listed the first pages
+            url = task['state']['url']
+            page = task['state']['page']
+            time_stop_thread = datetime.fromisoformat(task['state']['time_stop_thread'])
+            logging.info("Resuming listing at page {} {}".format(page, url))
 
-                tags_thread = list(map(lambda x: x.text ,tags_a[0:-1]))
+        while True:
+            if not url in prefetched and page<total_pages:
+                yield from self.fetch_window_steps('threads', initial_url, page, total_pages, prefetched)
 
-                answers = post.parent.parent.find('div', class_="structItem-cell--meta").find_all("dl")[0].find_all("dd")[0].text
-                visits = post.parent.parent.find('div', class_="structItem-cell--meta").find_all("dl")[1].find_all("dd")[0].text
+            if url in prefetched:
+                listing = prefetched.pop(url)
+            else:
+                listing = yield ('threads', url)
+            if listing==None:
+                logging.error("html returned None. Operation stopped. (2) {}".format(url))
+                break
 
-                try:
-                    last_post = post.parent.parent.find("div", class_="structItem-cell--latest").find('time')['datetime']
-                    last_post_datetime = last_post[0:-2]+":"+last_post[-2:]
-                    last_post_datetime = datetime.fromisoformat(last_post_datetime)
-                except:
-                    last_post_datetime = datetime.min
-                    last_post_datetime = last_post_datetime.replace(tzinfo=pytz.timezone('America/Sao_Paulo'))
-                    last_post = default(last_post_datetime)
-                    last_post = last_post[0:-3]+last_post[-2:]
+            res['total_pages'] = listing['total_pages']
+            total_pages = listing['total_pages']
 
+            page_threads = [] # rows added or updated by this page
+            for row in listing['threads']:
 
-                if not is_fixed:
-                    if last_post_datetime<time_stop_thread: # Avoid to continue checking old threads
+                if not row['is_fixed']:
+                    if parsers.parse_datetime(row['last_post'])<time_stop_thread: # Avoid to continue checking old threads
                         reach_oldest_record = True
                         break
 
-                thread_found = {
-                        'category': cat_id,
-                        'subcategory': sub_id,
-                        'title': title,
-                        'href': href,
-                        'member_href': member_href,
-                        'member_name': member_name,
-                        'date_thread': date_thread,
-                        'tags': tags_thread,
-                        'answers' : answers,
-                        'visits' : visits,
-                        'last_post' : last_post,
-                        'is_fixed' : is_fixed,
-                    }
-
-                ok = False
-                for i in range(len(res['threads'])):
-                    if res['threads'][i]['href']==href:
-                        ok = True
-                        thread_found['id'] = res['threads'][i]['id']
-                        res['threads'][i] = thread_found
-                        break
-                if not ok:
+                thread_found = {'category': cat_id, 'subcategory': sub_id}
+                thread_found.update(row)
+
+                i = index_href.get(thread_found['href'])
+                if i!=None:
+                    thread_found['id'] = res['threads'][i]['id']
+                    res['threads'][i] = thread_found
+                else:
                     thread_found['id'] = self.get_new_id()
 
                     res['total_threads'] += 1 # TODO validate if this is a new thread
+                    index_href[thread_found['href']] = len(res['threads'])
                     res['threads'].append(thread_found)
+                page_threads.append(thread_found)
 
 
-            self.write_json(dst_file, res)
+            self.serializer.write(dst_base, res)
+            self.catalog.put_threads(page_threads, self.threads_folder, self.serializer.format.document_ext)
+            self.catalog.put_subcategory(res, dst_file)
 
             if reach_oldest_record: # Avoid to continue checking old threads
                 break
 
-            if len(html.find_all("a", class_="pageNav-jump--next"))>0:
-                next_page_url = html.find("a", class_="pageNav-jump--next")['href']
-                next_page_url = urllib.parse.urljoin(self.base_url, next_page_url)
-
-                url = next_page_url
+            if listing['next']!=None:
+                url = listing['next']
+                page += 1
+                if task!=None:
+                    self.frontier.save_state(task, {'url': url, 'page': page, 'time_stop_thread': time_stop_thread.isoformat()})
             else:
                 break
 
 
 
         res['status'] = 'complete'
-        self.write_json(dst_file, res)
+        self.serializer.write(dst_base, res)
+        self.catalog.put_subcategory(res, dst_file)
 
         return True
 
     def print_summary(self):
-        self.load_threads()
         logging.info('Showing summary')
+        summary = self.catalog.summary()
         print("URL:\t\t\t{}".format(self.base_url))
         print("Domain:\t\t\t{}".format(self.domain))
         print("Amt. Categories:\t{}".format(len(self.categories)))
         print("Amt. SubCategories:\t{}".format(sum([len(x['subs']) for x in self.categories])))
-        print("Amt. Threads:\t\t{}".format(len(self.threads)))
+        print("Amt. Threads:\t\t{}".format(summary['threads']))
+        print("Amt. Threads mined:\t{}".format(summary['threads_complete']))
+        print("Amt. Posts:\t\t{}".format(summary['posts']))
 
     def reload_threads(self):
         logging.info("Reloading threads")
 
         # Any updates on categories file must be in this function
 
-        threads_running = []
-
-        for category in self.categories:
-            for sub in category['subs']:
-                logging.info("Reloading threads from: {}".format(sub['title_href']))
-                # self.get_threads_page(category['id'], sub['id'], sub['title_href'])
-
-                x = threading.Thread(target=self.get_threads_page, args=(category['id'], sub['id'], sub['title_href'],))
-                threads_running.append(x)
-                x.start()
-
-                while True:
-                    threads_running = [thread for thread in threads_running if thread.is_alive()]
-                    time.sleep(0.1)
+        def listings():
+            for category in self.categories:
+                for sub in category['subs']:
+                    yield "subcategory-{}".format(sub['id']), {'category': category['id'], 'sub': sub['id'], 'url': sub['title_href']}
 
-                    if len(threads_running)<self.max_request:
-                        break
+        if not self.frontier.start("reload_threads", listings(), self.resume):
+            return
 
+        def jobs():
+            for task in self.frontier.leases("reload_threads"):
+                logging.info("Reloading threads from: {}".format(task['payload']['url']))
+                yield self.task_steps(task, self.get_threads_page_steps(task['payload']['category'], task['payload']['sub'], task['payload']['url'], task))
 
-        for x in threads_running:
-            x.join()
+        self.phase = "reload_threads"
+        self.start_reporter()
+        try:
+            self.run_jobs(jobs(), "reload_threads")
+        finally:
+            self.stop_reporter() # last report, with the phase
+            self.phase = None
+        self.frontier.finish("reload_threads")
 
         logging.info("Reloading threads completed")
 
-    def load_threads(self):
-        logging.info("Reading threads to memmory")
+    def start_reporter(self): # metrics files and progress line, only while a phase runs
+        if self.metrics_interval>0 and self.reporter==None:
+            self.reporter = Reporter(self.metrics, self.config_folder, self.metrics_interval, self.progress)
+            self.reporter.start()
 
-        self.threads = []
-        self.threads_href = {}
-        for file in os.listdir(self.categories_folder):
-            dat = None
-            with open(self.categories_folder+file, "r") as f:
-                dat = f.read()
+    def stop_reporter(self):
+        if self.reporter!=None:
+            self.reporter.stop()
+            self.reporter = None
 
-            dat = json.loads(dat)
+    def progress(self): # (phase, tasks done, tasks total) for the progress line
+        phase = self.phase # read once, the reporter thread races with the end of the phase
+        if phase==None:
+            return None, 0, 0
+        done, total = self.frontier.progress(phase)
+        return phase, done, total
 
-            self.threads += dat['threads']
+    def task_steps(self, task, steps): # run the steps of a frontier task and acknowledge it
+        try:
+            result = yield from steps
+        except Exception as e:
+            logging.error("ERROREXCEPTION task {} {}".format(task['key'], str(e)))
+            self.frontier.fail(task)
+            return None
+        self.frontier.ack(task)
+        return result
 
-        for i in range(len(self.threads)):
-            t = self.threads[i]
-            self.threads_href[t['href']] = self.threads[i]
+    def run_jobs(self, jobs, name): # run *_steps generators with the selected engine
+        if self.engine=="async":
+            from async_engine import AsyncEngine # aiohttp is only required by this engine
+            AsyncEngine(self).run_jobs(jobs)
+            return
 
-        logging.info("Reading threads to memmory completed. Total: {}".format(len(self.threads)))
+        try:
+            Scheduler(self.max_request, name, metrics=self.metrics).run((self.run_steps, (steps,)) for steps in jobs)
+        finally:
+            self.log_connection_stats()
+
+    def write_json(self, dst, content): # small configuration files. Always indented json
+        write_atomic(dst, json.dumps(content, indent=2, default=default))
+
+    def page_url(self, url, page): # url of a page of a thread or listing
+        if page==1:
+            return url
+        return url+"page-{}".format(page)
+
+    def fetch_window_steps(self, kind, url, page, total_pages, prefetched):
+        # Fan-out: download the pages page..page+fan_out-1 of url together and keep them in prefetched (url -> page).
+        # The caller still walks them in order, so the early stops and the order of the stored data do not change
+        urls = []
+        for p in range(page, min(page+self.fan_out, total_pages+1)):
+            if not self.page_url(url, p) in prefetched:
+                urls.append(self.page_url(url, p))
+        if len(urls)<=1: # nothing to do together
+            return
 
-    def write_json(self, dst, content):
-        with open(dst, "w") as f:
-            f.write(json.dumps(content, indent=2, default=default))
+        pages = yield [(kind, u) for u in urls]
+        prefetched.update(zip(urls, pages))
 
     def search_page_message(self, url, guess_page, limit):
+        return self.run_steps(self.search_page_message_steps(url, guess_page, limit))
+
+    def search_page_message_steps(self, url, guess_page, limit, probed=None):
+        # Last page starting before limit. Posts are sorted by date, so a page is "before" when its first
+        # post is older than limit. Gallops forward (or back) from guess_page, then bisects. Every page
+        # downloaded is kept in probed (url -> page) for the caller.
 
         logging.info("Searching where to restart mining url: {} guesspage: {} limit: {}".format(url, guess_page, limit))
-        found = False
-        while guess_page>1:
-            url_with_page = url+"page-{}".format(guess_page)
+        if probed==None:
+            probed = {}
+
+        lo = 1 # last page known to start before limit
+        hi = None # first page known to start after limit
+        step = 1
+        start = guess_page # stored amount of pages, where the mining restarts when the search fails
+        guess_page = max(guess_page, 2) # page 1 is where the mining restarts anyway
+        while guess_page>lo and (hi==None or guess_page<hi):
+            url_with_page = self.page_url(url, guess_page)
             logging.info("Checking url: {}".format(url_with_page))
 
-            html = self.get_html(url_with_page)
-            if html==None:
+            if url_with_page in probed: # the last page, answered to a request past the end
+                page = probed[url_with_page]
+            else:
+                page = yield ('posts', url_with_page)
+            if page==None:
                 logging.error("html returned None. Operation stopped. (3) {}".format(url_with_page))
+                if lo==1: # nothing known. Restart on the stored last page instead of downloading the whole thread again
+                    lo = start
+                    if hi!=None:
+                        lo = max(1, min(lo, hi-1))
                 break
-
-            for message in html.find_all('article', class_="message--post"):
-
-                creation_time = message.find('div', class_="message-cell--main").find('header').find('time')['datetime']
-                creation_time = creation_time[0:-2]+":"+creation_time[-2:]
-                creation_time = datetime.fromisoformat(creation_time)
-                if creation_time<limit:
-                    found = True
+            if guess_page>page['total_pages']: # past the end. The server answered with the last page
+                hi = page['total_pages']+1
+                guess_page = page['total_pages']
+                probed[self.page_url(url, guess_page)] = page
+                continue
+            probed[url_with_page] = page
+
+            posts = page['posts']
+            if len(posts)>0 and parsers.parse_datetime(posts[0]['creation'])<limit:
+                lo = guess_page
+                if parsers.parse_datetime(posts[-1]['creation'])>=limit or guess_page>=page['total_pages']: # limit is in this page
                     break
+            else:
+                hi = guess_page
 
-            if found:
-                break
-            guess_page -= 1
+            if hi==None: # gallop forward
+                guess_page = min(lo+step, page['total_pages'])
+            elif lo==1 and hi-step>lo: # gallop back
+                guess_page = hi-step
+            else:
+                guess_page = (lo+hi)//2
+            step *= 2
 
-        logging.info("Page to restart is: {}".format(guess_page))
-        return guess_page
+        logging.info("Page to restart is: {} ({} pages checked)".format(lo, len(probed)))
+        return lo
 
     def requesta(self, thread):
+        return self.run_steps(self.requesta_steps(thread))
+
+    def requesta_steps(self, thread, task=None): # generator. Yields (kind, url) and receives the extracted page. task: frontier task
         thread = thread.copy()
+        listing = {'last_post': thread['last_post'], 'answers': thread['answers']} # stored when the thread is mined to the end
         try:
             logging.info("Requesting posts from {}".format(str(thread)))
 
-            thread_file = self.threads_folder+"{}.json".format(thread['id'])
+            thread_id = thread['id']
+            href = thread['href']
 
             page = 1
             url = None
+            probed = {} # pages downloaded while searching where to restart
 
             create_new_thread_file = True
-            if os.path.isfile(thread_file): # TODO We are researching every thread. We may check the interval between the last two messages
-                logging.info("Cache hit thread id {}".format(thread['id']))
-
+            if self.thread_store.exists(thread_id): # TODO We are researching every thread. We may check the interval between the last two messages
+                logging.info("Cache hit thread id {}".format(thread_id))
 
-                with open(thread_file, "r") as f:
-                    thread = json.loads(f.read())
-
-                if len(thread['messages'])>0:
+                last_message = self.thread_store.last_message(thread_id)
+                if last_message!=None:
                     create_new_thread_file = False
 
-                    thread['status'] = "reloading"
-
-                    most_recent_message = thread['messages'][-1]['creation']
-                    most_recent_message = most_recent_message[0:-2]+":"+most_recent_message[-2:]
-                    most_recent_message = datetime.fromisoformat(most_recent_message)
+                    thread = self.thread_store.load_header(thread_id)
+                    most_recent_message = parsers.parse_datetime(last_message['creation'])
 
-                    page = self.search_page_message(thread['href'], thread['total_pages'], most_recent_message)
+                    if task!=None and task['state']!=None: # the interrupted run saved the next page
+                        page = task['state']['page']
+                    else:
+                        page = yield from self.search_page_message_steps(thread['href'], thread['total_pages'], most_recent_message, probed)
                     ignore_before = most_recent_message
 
                     url = thread['href']
@@ -641,19 +879,22 @@ class Manager(Base):
                 thread['started'] = datetime.now()
                 thread['total_pages'] = page # if repeate the variable here the json will look better
                 thread['total_posts'] = 0
-                thread['messages'] = []
                 thread['last_update'] = datetime.now()
+                for k in listing: # written when the thread is mined to the end, so an interrupted one is reloaded
+                    thread.pop(k, None)
                 url = thread['href']
 
-                ignore_before = datetime.min.replace(tzinfo=pytz.timezone('America/Sao_Paulo'))
-                self.write_json(thread_file, thread)
+                ignore_before = parsers.min_datetime()
+                self.thread_store.create(thread_id, thread)
 
             thread = None
             posts_to_add = []
             counter_page_to_save = 0
-            save_every_x_page = 40
+            save_every_x_page = 10 # also the resume point of an interrupted run
 
             visited_urls = []
+            reached_end = False
+            total_pages = page
             try:
                 while True:
 
@@ -662,75 +903,45 @@ class Manager(Base):
                         break
                     
                     visited_urls.append(url)
-                    html = self.get_html(url)
-                    if html==None:
-                        logging.error("html returned None. Operation stopped. (4) {}".format(url))
-                        break
+                    if not url in probed and page<total_pages:
+                        yield from self.fetch_window_steps('posts', href, page, total_pages, probed)
 
+                    if url in probed:
+                        html = probed.pop(url)
+                    else:
+                        html = yield ('posts', url)
                     if html==None:
+                        logging.error("html returned None. Operation stopped. (4) {}".format(url))
                         break
 
-                    for message in html.find_all('article', class_="message--post"):
+                    for post in html['posts']:
 
-
-                        official_id = message['data-content']
-                        user = message.find('div', class_="message-cell--user").find('a', class_="username")
-
-                        try:
-                            user_name = user.text
-                            user_href = user['href']
-                        except:
-                            user_name = ''
-                            user_href = ''
-
-                        creation_time = message.find('div', class_="message-cell--main").find('header').find('time')['datetime']
-
-
-                        creation_time_obj = creation_time[0:-2]+":"+creation_time[-2:]
-                        creation_time_obj = datetime.fromisoformat(creation_time_obj)
-
-                        if creation_time_obj<=ignore_before:
+                        if parsers.parse_datetime(post['creation'])<=ignore_before:
                             continue
 
-
-
-                        message = str(message.find('div', class_="message-cell--main").find('article', class_='message-body').find('div', class_='bbWrapper'))
-
-
-                        posts_to_add.append({
-                            'official_id': official_id,
-                            'user_name': user_name,
-                            'user_href': user_href,
-                            'creation': creation_time,
-                            'message': message,
-                        })
+                        posts_to_add.append(post)
 
                     counter_page_to_save += 1
+                    total_pages = html['total_pages']
 
-                    has_next = len(html.find_all("a", class_="pageNav-jump--next"))>0
+                    has_next = html['next']!=None
 
                     if counter_page_to_save%save_every_x_page==0 or not has_next:
                         counter_page_to_save = 0
-                        with open(thread_file, 'r') as f:
-                            thread = json.loads(f.read())
-
-                        thread['total_pages'] = page
-                        thread['total_posts'] = len(thread['messages'])
-                        thread['last_update'] = datetime.now()
-
-                        thread['messages']+= posts_to_add
+                        self.thread_store.append(thread_id, posts_to_add, {'total_pages': page, 'last_update': datetime.now()})
+                        self.metrics.inc('posts_stored_total', len(posts_to_add))
                         posts_to_add = []
-
-                        self.write_json(thread_file, thread)
-                        thread = None
+                        if task!=None and has_next:
+                            self.frontier.save_state(task, {'page': page+1})
 
 
                     must_break = True
                     if has_next:
-                        url = html.find("a", class_="pageNav-jump--next")['href']
-                        url = urllib.parse.urljoin(self.base_url, url)
+                        url = html['next']
                         page += 1
                         must_break = False
+                    else:
+                        reached_end = True
                     
                     if must_break:
                         break
@@ -739,48 +950,43 @@ class Manager(Base):
 
             except Exception as e:
                 # print(e)
-                logging.error("ERROREXCEPTION (1) {} {} {}".format(str(e), url))
-
+                logging.error("ERROREXCEPTION (1) {} {}".format(str(e), url))
 
 
-            with open(thread_file, 'r') as f:
-                thread = json.loads(f.read())
 
-            thread['status'] = "complete"
-            thread['total_pages'] = page
-            thread['total_posts'] = len(thread['messages'])
-            thread['last_update'] = datetime.now()
-
-            thread['messages']+= posts_to_add
+            updates = {'status': "incomplete", 'total_pages': page, 'last_update': datetime.now()}
+            if reached_end: # otherwise the next reload must check the thread again
+                updates['status'] = "complete"
+                updates.update(listing)
+            header = self.thread_store.append(thread_id, posts_to_add, updates)
+            self.catalog.put_mined(thread_id, header)
+            self.metrics.inc('posts_stored_total', len(posts_to_add))
+            if reached_end:
+                self.metrics.inc('threads_completed_total')
             posts_to_add = []
-
-            self.write_json(thread_file, thread)
         except Exception as e:
             # print(e)
             logging.error("ERROREXCEPTION (2) {} {}".format(str(thread), str(e)))
 
     def reload_posts(self):
         logging.info("Starting to reload posts")
-        self.load_threads()
 
-        threads_running = []
-        for i in range(len(self.threads)):
+        def threads():
+            logging.info("Threads changed since the last reload: {} of {}".format(self.catalog.count_pending(self.force), self.catalog.summary()['threads']))
+            for thread in self.catalog.pending_threads(self.force):
+                yield "thread-{}".format(thread['id']), thread
 
-            t = self.threads[i]
-
-            x = threading.Thread(target=self.requesta, args=(t,))
-            threads_running.append(x)
-            x.start()
-
-
-            while True:
-                threads_running = [thread for thread in threads_running if thread.is_alive()]
-                time.sleep(0.1)
-
-                if len(threads_running)<self.max_request:
-                    break
+        if not self.frontier.start("reload_posts", threads(), self.resume):
+            return
 
-        for x in threads_running:
-            x.join()
+        jobs = (self.task_steps(task, self.requesta_steps(task['payload'], task)) for task in self.frontier.leases("reload_posts"))
+        self.phase = "reload_posts"
+        self.start_reporter()
+        try:
+            self.run_jobs(jobs, "reload_posts")
+        finally:
+            self.stop_reporter() # last report, with the phase
+            self.phase = None
+        self.frontier.finish("reload_posts")
 
-        logging.info("Reload posts completed")
\ No newline at end of file
+        logging.info("Reload posts completed")
@@ -1,7 +1,8 @@
 import argparse
-import json
 import os
 from urllib.parse import urlparse
+from thread_store import ThreadStore
+from serializer import Serializer
 
 class Anonymizer:
 
@@ -14,6 +15,7 @@ class Anonymizer:
         self.folder_cat  = self.config_folder+"categories_threads/" # must exist
 
         self.config = {'users_ids':{}, 'last_id': 0}
+        self.serializer = Serializer(None) # files keep their format
 
         if not os.path.exists(self.config_folder):
             raise Exception("Config folder not found: {}".format(self.config_folder))
@@ -35,10 +37,11 @@ class Anonymizer:
         files = os.listdir(self.folder_cat)
 
         for file in files:
-            with open(self.folder_cat+file, 'r') as file_o:
-                content = file_o.read()
+            base = self.serializer.base_name(file)
+            if base==None:
+                continue
 
-            content = json.loads(content)
+            content = self.serializer.read(self.folder_cat+base)
 
             for i in range(len(content['threads'])):
 
@@ -47,19 +50,15 @@ class Anonymizer:
 
 
 
-            with open(self.folder_cat+file, 'w') as file_o:
-                file_o.write(json.dumps(content, indent=2))
+            self.serializer.write(self.folder_cat+base, content)
 
 
 
 
-        files = os.listdir(self.folder)
+        store = ThreadStore(self.folder, self.serializer)
 
-        for file in files:
-            with open(self.folder+file, 'r') as file_o:
-                content = file_o.read()
-
-            content = json.loads(content)
+        for thread_id in store.list_ids():
+            content = store.load(thread_id)
 
             content['member_name'] = self.anonymizer_user(content['member_href'])
             content['member_href'] = ''
@@ -68,8 +67,7 @@ class Anonymizer:
                 content['messages'][i]['user_name'] = self.anonymizer_user(content['messages'][i]['user_href'])
                 content['messages'][i]['user_href'] = ''
 
-            with open(self.folder+file, 'w') as file_o:
-                file_o.write(json.dumps(content, indent=2))
+            store.write(thread_id, content)
 
 
 def main(url):
@@ -0,0 +1,176 @@
+import asyncio
+import logging
+import time
+import aiohttp
+import parsers
+from page_cache import conditional_headers
+from rate_limiter import RetryableHTTPError, RETRY_STATUS, THROTTLE_STATUS
+
+ACCEPT_ENCODING = "gzip, deflate"
+try:
+    import brotli # aiohttp decodes br when brotli is installed
+    ACCEPT_ENCODING += ", br"
+except ImportError:
+    pass
+
+
+def advance(function, *args): # one step of a generator, run by asyncio.to_thread. StopIteration can not cross a Future
+    try:
+        return False, function(*args)
+    except StopIteration as stop:
+        return True, stop.value
+
+
+class AsyncEngine: # runs the Manager *_steps generators as coroutines instead of one thread per task
+    # The code of the generators between two pages (thread files, frontier and catalog) and the page cache
+    # block on disk, so they run in the default executor and the loop keeps serving the other requests.
+
+    def __init__(self, manager):
+        self.manager = manager
+        self.metrics = manager.metrics
+        self.max_request = manager.max_request
+        self.session = None
+        self.slots = None # condition guarding in_flight
+        self.in_flight = 0
+        self.lock_jobs = None # jobs is a generator shared by the workers
+        logging.info("AsyncEngine created with max_request: {}".format(self.max_request))
+
+    def limit(self): # requests allowed in flight
+        if self.manager.concurrency!=None:
+            return self.manager.concurrency.current_limit()
+        return self.max_request
+
+    async def acquire_slot(self):
+        async with self.slots:
+            await self.slots.wait_for(lambda: self.in_flight<self.limit())
+            self.in_flight += 1
+
+    async def release_slot(self, started, error):
+        if self.manager.concurrency!=None:
+            self.manager.concurrency.record(time.time()-started, error=error!=None, throttled=getattr(error, 'status', None) in THROTTLE_STATUS)
+        async with self.slots:
+            self.in_flight -= 1
+            self.slots.notify_all()
+
+    async def get_content(self, url):
+        logging.info("Will request URL: {}".format(url))
+
+        cached, validators = await asyncio.to_thread(self.manager.cache_read, url)
+        if cached!=None and not self.manager.cache_revalidate:
+            logging.info("Cache HIT URL: {}".format(url))
+            self.metrics.inc('cache_total', result="hit")
+            return cached
+        if self.manager.cache_pages and cached==None:
+            self.metrics.inc('cache_total', result="miss")
+
+        headers = {}
+        if cached!=None:
+            headers = conditional_headers(validators)
+
+        await asyncio.sleep(self.manager.rate_limiter.reserve(url))
+        await self.acquire_slot()
+        self.metrics.add('in_flight', 1)
+        started = time.time()
+        error = None
+        try:
+            logging.info("Requesting URL: {}".format(url))
+            async with self.session.get(url, headers=headers) as resp:
+                body = await resp.read()
+                self.metrics.inc('requests_total', status=str(resp.status))
+                self.metrics.inc('bytes_received_total', getattr(resp.content, 'total_raw_bytes', len(body))) # before decompression. Older aiohttp only gives the decompressed size
+                if resp.status in RETRY_STATUS:
+                    raise RetryableHTTPError(url, resp.status, resp.headers.get('Retry-After'))
+
+                if resp.status==304 and cached!=None: # not modified since cached
+                    logging.info("Cache HIT (revalidated) URL: {}".format(url))
+                    self.metrics.inc('cache_total', result="revalidated")
+                    return cached
+
+                content = await resp.text(errors="replace")
+                await asyncio.to_thread(self.manager.cache_write, url, content, resp.headers)
+        except Exception as e:
+            if not isinstance(e, RetryableHTTPError):
+                self.metrics.inc('requests_total', status="error")
+            error = e
+            raise
+        finally:
+            self.metrics.observe('request_seconds', time.time()-started)
+            self.metrics.add('in_flight', -1)
+            await self.release_slot(started, error)
+
+        return content
+
+    async def get_page(self, kind, url): # same retry control as Base.get_html
+        content = None
+        attempt = 0
+        while attempt<self.manager.max_retries:
+            attempt += 1
+            try:
+                content = await self.get_content(url)
+                break
+            except RetryableHTTPError as e:
+                logging.error("ERROR getting HTML: {}".format(e))
+                cause = str(e.status)
+                delay = self.manager.rate_limiter.backoff(url, attempt, e.status, e.retry_after)
+            except Exception as e:
+                logging.error("ERROR getting HTML: {}".format(e))
+                cause = type(e).__name__
+                delay = self.manager.rate_limiter.backoff(url, attempt)
+
+            if attempt<self.manager.max_retries:
+                self.metrics.inc('retries_total', cause=cause)
+                await asyncio.sleep(delay)
+
+        if content==None:
+            self.metrics.inc('failures_total')
+            return None
+
+        loop = asyncio.get_event_loop() # parse outside the loop. In the process pool when there is one
+        started = time.time()
+        page = await loop.run_in_executor(self.manager.parse_pool, parsers.parse_page, kind, content, self.manager.base_url, self.manager.parser)
+        self.manager.record_parse(kind, started)
+        return page
+
+    async def run_steps(self, steps): # async version of Base.run_steps
+        done, request = await asyncio.to_thread(advance, next, steps)
+        while not done:
+            try:
+                if type(request) is list: # fan-out. Every page of the list at once, under the same slots
+                    page = await asyncio.gather(*[self.get_page(*r) for r in request])
+                else:
+                    page = await self.get_page(*request)
+            except Exception as e: # raised where the generator asked for the page, so it saves what it has
+                done, request = await asyncio.to_thread(advance, steps.throw, e)
+                continue
+            done, request = await asyncio.to_thread(advance, steps.send, page)
+        return request
+
+    async def next_job(self, jobs): # None when there is no job left
+        async with self.lock_jobs:
+            return await asyncio.to_thread(next, jobs, None) # leases the task in the frontier
+
+    async def worker(self, jobs):
+        while True: # jobs is shared by all workers
+            steps = await self.next_job(jobs)
+            if steps==None:
+                return
+            try:
+                await self.run_steps(steps)
+            except Exception as e:
+                logging.error("ERROREXCEPTION async worker {}".format(str(e)))
+
+    async def run(self, jobs):
+        headers = dict(self.manager.base_header)
+        headers['Accept-Encoding'] = ACCEPT_ENCODING
+
+        connector = aiohttp.TCPConnector(limit=self.max_request, limit_per_host=self.max_request)
+        timeout = aiohttp.ClientTimeout(total=None, sock_connect=self.manager.timeout[0], sock_read=self.manager.timeout[1])
+
+        async with aiohttp.ClientSession(headers=headers, connector=connector, timeout=timeout) as session:
+            self.session = session
+            self.slots = asyncio.Condition()
+            self.lock_jobs = asyncio.Lock()
+            await asyncio.gather(*[self.worker(jobs) for i in range(self.max_request)])
+
+    def run_jobs(self, jobs): # jobs: *_steps generators
+        asyncio.run(self.run(jobs))
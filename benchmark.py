@@ -0,0 +1,309 @@
+import argparse
+import datetime
+import gzip
+import logging
+import multiprocessing
+import os
+import random
+import resource
+import shutil
+import tempfile
+import time
+
+import parsers
+from conversations import ReplyGraph
+
+
+def peak_rss_mb(): # peak resident memory of this process
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024.0 # kB on linux
+
+def read_pages(folder): # saved pages: .html, or the compressed files of cache_html/
+    pages = []
+    for dp, dn, filenames in os.walk(folder):
+        for f in sorted(filenames):
+            path = os.path.join(dp, f)
+            if f.endswith(".html"):
+                with open(path, "r") as fo:
+                    pages.append(fo.read())
+            elif f.endswith(".html.gz"):
+                with open(path, "rb") as fo:
+                    pages.append(gzip.decompress(fo.read()).decode("utf-8"))
+            elif f.endswith(".html.zst"):
+                import zstandard
+                with open(path, "rb") as fo:
+                    pages.append(zstandard.ZstdDecompressor().decompress(fo.read()).decode("utf-8"))
+    return pages
+
+def page_kind(content):
+    if "message--post" in content:
+        return "posts"
+    if "structItem-title" in content:
+        return "threads"
+    return None
+
+
+def bench_parser(backend, pages, base_url, repeat, results):
+    rss_before = peak_rss_mb()
+    items = 0
+    start = time.time()
+    for r in range(repeat):
+        for kind, content in pages:
+            res = parsers.parse_page(kind, content, base_url, backend)
+            items += len(res[kind])
+    total = time.time()-start
+
+    results.put({
+        'backend': backend,
+        'pages': len(pages)*repeat,
+        'items': items,
+        'seconds': total,
+        'pages_per_second': len(pages)*repeat/max(total, 1e-9),
+        'peak_rss_mb': peak_rss_mb()-rss_before,
+    })
+
+def cpu_seconds(pool=None): # user+system time of this process and of the running workers of pool (parse workers)
+    t = os.times()
+    total = t.user+t.system
+    if pool!=None:
+        for pid in list(pool._processes or {}): # children only count in os.times once they exit, at the end of the crawl
+            try:
+                with open("/proc/{}/stat".format(pid)) as f:
+                    fields = f.read().rsplit(")", 1)[1].split() # the name may have spaces
+            except OSError: # exited
+                continue
+            total += (int(fields[11])+int(fields[12]))/os.sysconf("SC_CLK_TCK") # utime and stime
+    return total
+
+def bench_crawl(url, engine, options, recrawl, results): # runs in its own process, inside a temporary folder
+    from MinerXenForo import Manager
+
+    folder = tempfile.mkdtemp(prefix="benchmark_crawl_")
+    os.chdir(folder)
+    logging.basicConfig(filename=folder+"/log_minerxenforo.log", level=logging.INFO)
+
+    mng = Manager(url, engine=engine, metrics_interval=0, **options)
+    phases = [("reload_threads", mng.reload_threads), ("reload_posts", mng.reload_posts)]
+    if recrawl: # nothing changed. Measures the cost of a periodic update
+        phases += [("recrawl_threads", mng.reload_threads), ("recrawl_posts", mng.reload_posts)]
+
+    try:
+        for name, run in phases:
+            if name=="recrawl_threads":
+                mng.frontier.discard() # a new run, not the resume of the previous one
+            pages = mng.metrics.total('pages_total')
+            requests = mng.metrics.total('requests_total')
+            posts = mng.metrics.total('posts_stored_total')
+            cpu = cpu_seconds(mng.parse_pool)
+            start = time.time()
+            run()
+            total = time.time()-start
+            cpu = cpu_seconds(mng.parse_pool)-cpu
+            pages = mng.metrics.total('pages_total')-pages
+
+            results.put({
+                'engine': engine,
+                'phase': name,
+                'pages': pages,
+                'requests': mng.metrics.total('requests_total')-requests,
+                'posts': mng.metrics.total('posts_stored_total')-posts,
+                'seconds': total,
+                'pages_per_second': pages/max(total, 1e-9),
+                'cpu_seconds': cpu,
+                'cpu_percent': 100.0*cpu/max(total, 1e-9),
+                'peak_rss_mb': peak_rss_mb(),
+            })
+    finally:
+        mng.close()
+        os.chdir("/")
+        shutil.rmtree(folder, ignore_errors=True)
+    results.put(None)
+
+def main_crawl(engines, max_request, fan_out, parse_workers, parser, serializer, categories, subs, threads, posts, post_words, latency, error_rate, recrawl):
+    import fake_xenforo
+
+    forum = fake_xenforo.Forum(categories, subs, threads, posts, post_words=post_words)
+    server = fake_xenforo.serve(forum, latency=latency, error_rate=error_rate)
+    url = fake_xenforo.url_of(server)
+    print("Forum: {} subcategories, {} threads, {} posts. Latency: {}s error rate: {}".format(categories*subs, len(forum.threads), sum(len(t['posts']) for t in forum.threads.values()), latency, error_rate))
+
+    options = {'max_request': max_request, 'fan_out': fan_out, 'parse_workers': parse_workers, 'parser': parser, 'serializer': serializer}
+    print("{:<8}\t{:<16}\t{:>8}\t{:>8}\t{:>8}\t{:>8}\t{:>10}\t{:>8}\t{:>14}".format("engine", "phase", "pages", "requests", "posts", "seconds", "pages/s", "CPU %", "peak RSS (MB)"))
+    for engine in engines:
+        results = multiprocessing.Queue()
+        x = multiprocessing.Process(target=bench_crawl, args=(url, engine, options, recrawl, results)) # one process per engine to isolate memory and CPU
+        x.start()
+        while True:
+            res = results.get()
+            if res==None:
+                break
+            print("{engine:<8}\t{phase:<16}\t{pages:>8}\t{requests:>8}\t{posts:>8}\t{seconds:>8.2f}\t{pages_per_second:>10.1f}\t{cpu_percent:>8.1f}\t{peak_rss_mb:>14.1f}".format(**res))
+        x.join()
+
+    server.shutdown()
+    print("Server answers: {}".format(server.stats))
+
+def read_messages(url, limit): # html of the messages of a mined forum
+    from cleaner import Cleaner
+
+    cleaner = Cleaner(url, 0, float('inf'), False, False, 1, False)
+    messages = []
+    for thread_id in cleaner.thread_store.list_ids():
+        for m in cleaner.thread_store.read_messages(thread_id):
+            messages.append(m['message'])
+            if len(messages)>=limit:
+                return cleaner, messages
+    return cleaner, messages
+
+def convert_all(convert, messages): # (outputs, seconds). An output is the text or the exception type
+    res = []
+    start = time.time()
+    for m in messages:
+        try:
+            res.append(convert(m))
+        except Exception as e:
+            res.append(type(e))
+    return res, time.time()-start
+
+def main_clean(url, limit, show):
+    from post_converter import PostConverter
+    from tests.reference_cleaner import ReferenceCleaner
+
+    cleaner, messages = read_messages(url, limit)
+    print("Messages: {}".format(len(messages)))
+    if len(messages)==0:
+        return
+
+    converter = PostConverter(cleaner.tags)
+    reference_cleaner = ReferenceCleaner(cleaner.tags)
+    reference = lambda m: (reference_cleaner.limpar_post(m), reference_cleaner.identify_conversations(m)) # text and quoted posts
+    golden, seconds_golden = convert_all(reference, messages)
+    res, seconds = convert_all(converter.extract, messages)
+    seconds_text = convert_all(converter.convert, messages)[1]
+
+    print("{:<40}\t{:>8}\t{:>10}".format("implementation", "seconds", "posts/s"))
+    print("{:<40}\t{:>8.2f}\t{:>10.1f}".format("limpar_post + identify_conversations", seconds_golden, len(messages)/max(seconds_golden, 1e-9)))
+    print("{:<40}\t{:>8.2f}\t{:>10.1f}".format("PostConverter.extract", seconds, len(messages)/max(seconds, 1e-9)))
+    print("{:<40}\t{:>8.2f}\t{:>10.1f}".format("PostConverter.convert (text only)", seconds_text, len(messages)/max(seconds_text, 1e-9)))
+
+    different = [i for i in range(len(messages)) if golden[i]!=res[i]] # golden-output comparison
+    print("Different outputs: {} of {}".format(len(different), len(messages)))
+    for i in different[0:show]:
+        print("\nMESSAGE {}\n{}\nreference:     {!r}\nPostConverter: {!r}".format(i, messages[i], golden[i], res[i]))
+
+def make_thread(posts, quote_rate, quotes, reach, rnd): # messages with the fields read by ReplyGraph
+    # A post quotes, with probability quote_rate, up to quotes of the reach posts before it.
+    start = datetime.datetime(2021, 1, 1)
+    messages = []
+    for i in range(posts):
+        targets = []
+        if i>0 and rnd.random()<quote_rate:
+            first = max(0, i-reach)
+            targets = sorted(set("#post-{}".format(rnd.randint(first, i-1)) for q in range(rnd.randint(1, quotes))))
+        messages.append({'official_id': "post-{}".format(i), 'isodate': start+datetime.timedelta(minutes=i), 'quote_targets': targets})
+    return messages
+
+def main_conversations(sizes, quote_rate, quotes, reach, reference_max, max_conversations, max_depth, seed):
+    from tests.reference_cleaner import reference_conversations
+
+    print("{:>8}	{:>14}	{:>10}	{:>12}	{:>10}	{:>12}	{:>10}".format("posts", "conversations", "longest", "ReplyGraph s", "posts/s", "reference s", "same"))
+    for size in sizes:
+        messages = make_thread(size, quote_rate, quotes, reach, random.Random(seed))
+
+        compare = size<=reference_max and max_conversations==None and max_depth==None
+        res = [] # kept only to compare, there may be too many
+        amount = 0
+        longest = 0
+        start = time.time()
+        for c in ReplyGraph(messages).conversations(max_conversations, max_depth):
+            amount += 1
+            longest = max(longest, len(c))
+            if compare:
+                res.append([m['official_id'] for m in c])
+        seconds = time.time()-start
+
+        seconds_reference = "-"
+        same = "-"
+        if compare:
+            start = time.time()
+            try:
+                golden = [[m['official_id'] for m in c] for c in reference_conversations(messages)]
+                seconds_reference = "{:.3f}".format(time.time()-start)
+                same = str(golden==res)
+            except RecursionError:
+                seconds_reference = "RecursionError"
+
+        print("{:>8}\t{:>14}\t{:>10}\t{:>12.3f}\t{:>10.1f}\t{:>12}\t{:>10}".format(size, amount, longest, seconds, size/max(seconds, 1e-9), seconds_reference, same))
+
+def main_parsers(folder, backends, repeat, base_url):
+    pages = []
+    for content in read_pages(folder):
+        kind = page_kind(content)
+        if kind!=None:
+            pages.append((kind, content))
+
+    print("Pages: {} (posts: {}, threads: {})".format(len(pages), len([p for p in pages if p[0]=="posts"]), len([p for p in pages if p[0]=="threads"])))
+    if len(pages)==0:
+        return
+
+    print("{:<12}\t{:>8}\t{:>10}\t{:>8}\t{:>12}\t{:>14}".format("backend", "pages", "items", "seconds", "pages/s", "peak RSS (MB)"))
+    for backend in backends:
+        results = multiprocessing.Queue()
+        x = multiprocessing.Process(target=bench_parser, args=(backend, pages, base_url, repeat, results)) # one process per backend to isolate memory
+        x.start()
+        res = results.get()
+        x.join()
+        print("{backend:<12}\t{pages:>8}\t{items:>10}\t{seconds:>8.2f}\t{pages_per_second:>12.1f}\t{peak_rss_mb:>14.1f}".format(**res))
+
+
+if __name__ == "__main__":
+
+    ap = argparse.ArgumentParser()
+    sub = ap.add_subparsers(dest="mode", required=True)
+
+    ap_parsers = sub.add_parser("parsers", help="Compare HTML parser backends on saved XenForo pages")
+    ap_parsers.add_argument("-f", "--folder", required=True, type=str, help="Folder with saved pages (.html) or a cache_html folder")
+    ap_parsers.add_argument("-b", "--backends", required=False, nargs="+", default=parsers.BACKENDS, choices=parsers.BACKENDS, help="Backends to compare")
+    ap_parsers.add_argument("-r", "--repeat", required=False, type=int, default=3, help="Times each page is parsed")
+    ap_parsers.add_argument("-url", required=False, type=str, default="https://localhost", help="Base URL used to resolve links")
+
+    ap_crawl = sub.add_parser("crawl", help="Run reload_threads and reload_posts against a local synthetic forum (fake_xenforo.py)")
+    ap_crawl.add_argument("-e", "--engines", required=False, nargs="+", default=["thread"], choices=["thread", "async"], help="Engines to compare")
+    ap_crawl.add_argument("-mr", "--max-request", required=False, default=8, type=int, help="Maximum simultaneous request")
+    ap_crawl.add_argument("-fo", "--fan-out", required=False, default=1, type=int, help="Pages of one thread or listing requested together")
+    ap_crawl.add_argument("-pw", "--parse-workers", required=False, default=0, type=int, help="Number of processes parsing downloaded pages")
+    ap_crawl.add_argument("-hp", "--html-parser", required=False, default="html.parser", choices=parsers.BACKENDS, help="HTML parser")
+    ap_crawl.add_argument("-sf", "--serializer", required=False, default="json", help="Format of category and thread files")
+    ap_crawl.add_argument("-c", "--categories", required=False, default=2, type=int, help="Categories of the forum")
+    ap_crawl.add_argument("-s", "--subs", required=False, default=3, type=int, help="Subcategories of each category")
+    ap_crawl.add_argument("-t", "--threads", required=False, default=100, type=int, help="Threads of each subcategory")
+    ap_crawl.add_argument("-m", "--posts", required=False, default=60, type=int, help="Maximum posts of a thread")
+    ap_crawl.add_argument("-w", "--post-words", required=False, default=20, type=int, help="Words in each post")
+    ap_crawl.add_argument("-l", "--latency", required=False, default=0.0, type=float, help="Seconds added by the server to every answer")
+    ap_crawl.add_argument("-er", "--error-rate", required=False, default=0.0, type=float, help="Fraction of requests answered with 503")
+    ap_crawl.add_argument("-rc", "--recrawl", required=False, action="store_true", help="Run both phases again on the unchanged forum")
+
+    ap_clean = sub.add_parser("clean", help="Compare the output and speed of limpar_post/identify_conversations (tests/reference_cleaner.py) and PostConverter on mined messages")
+    ap_clean.add_argument("-url", required=True, type=str, help="The base URL of a forum already mined")
+    ap_clean.add_argument("-l", "--limit", required=False, type=int, default=10000, help="Maximum amount of messages")
+    ap_clean.add_argument("-s", "--show", required=False, type=int, default=5, help="Different outputs printed")
+
+    ap_conversations = sub.add_parser("conversations", help="Compare conversations.ReplyGraph and the recursive mount_conversation (tests/reference_cleaner.py) on synthetic threads")
+    ap_conversations.add_argument("-n", "--sizes", required=False, nargs="+", type=int, default=[100, 500, 1000, 2000, 5000], help="Posts of each thread")
+    ap_conversations.add_argument("-qr", "--quote-rate", required=False, type=float, default=0.5, help="Fraction of posts quoting others")
+    ap_conversations.add_argument("-q", "--quotes", required=False, type=int, default=3, help="Maximum posts quoted by a post")
+    ap_conversations.add_argument("-r", "--reach", required=False, type=int, default=10, help="How many posts back a post may quote")
+    ap_conversations.add_argument("-rm", "--reference-max", required=False, type=int, default=2000, help="Largest thread given to the reference, it may take exponential time")
+    ap_conversations.add_argument("-mc", "--max-conversations", required=False, type=int, default=None, help="Conversations of a thread, as cleaner.py -mc. Skips the reference")
+    ap_conversations.add_argument("-md", "--max-depth", required=False, type=int, default=None, help="Posts of a conversation, as cleaner.py -md. Skips the reference")
+    ap_conversations.add_argument("-s", "--seed", required=False, type=int, default=1, help="Seed of the synthetic threads")
+
+    args = vars(ap.parse_args())
+
+    if args['mode']=="parsers":
+        main_parsers(args['folder'], args['backends'], args['repeat'], args['url'])
+    elif args['mode']=="crawl":
+        main_crawl(args['engines'], args['max_request'], args['fan_out'], args['parse_workers'], args['html_parser'], args['serializer'], args['categories'], args['subs'], args['threads'], args['posts'], args['post_words'], args['latency'], args['error_rate'], args['recrawl'])
+    elif args['mode']=="clean":
+        main_clean(args['url'], args['limit'], args['show'])
+    elif args['mode']=="conversations":
+        main_conversations(args['sizes'], args['quote_rate'], args['quotes'], args['reach'], args['reference_max'], args['max_conversations'], args['max_depth'], args['seed'])
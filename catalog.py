@@ -0,0 +1,110 @@
+import json
+import sqlite3
+import threading
+
+
+class Catalog: # subcategories and threads known by the miner, indexed by id and href
+    # The categories_threads/*.json and threads/<id>.json files are still written (the cleaner and the
+    # anonymizer read them). The catalog mirrors them, so summaries and the threads to reload are
+    # queries instead of reading every file into memory.
+
+    def __init__(self, file):
+        self.file = file
+
+        # locks
+        self.lock = threading.Lock()
+
+        self.db = sqlite3.connect(self.file, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("""CREATE TABLE IF NOT EXISTS subcategories (
+            id INTEGER PRIMARY KEY,
+            category INTEGER,
+            url TEXT,
+            file TEXT,
+            status TEXT,
+            total_pages INTEGER,
+            total_threads INTEGER
+        )""")
+        self.db.execute("""CREATE TABLE IF NOT EXISTS threads (
+            id INTEGER PRIMARY KEY,
+            href TEXT,
+            category INTEGER,
+            subcategory INTEGER,
+            last_post TEXT,
+            answers TEXT,
+            listing TEXT,
+            file TEXT,
+            status TEXT,
+            total_pages INTEGER,
+            total_posts INTEGER,
+            mined_last_post TEXT,
+            mined_answers TEXT
+        )""")
+        self.db.execute("CREATE INDEX IF NOT EXISTS threads_href ON threads (href)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS threads_subcategory ON threads (subcategory)")
+
+    def is_empty(self):
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*) FROM subcategories").fetchone()[0]==0
+
+    def put_subcategory(self, info, file): # info as in categories_threads/*.json
+        with self.lock:
+            self.db.execute("""INSERT INTO subcategories VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(id) DO UPDATE SET category=excluded.category, url=excluded.url, file=excluded.file,
+                status=excluded.status, total_pages=excluded.total_pages, total_threads=excluded.total_threads""",
+                (info['subcategory'], info['category'], info['url'], file, info['status'], info['total_pages'], info['total_threads']))
+
+    def put_threads(self, threads, folder, extension=".json"): # rows of a listing. The mining state is kept
+        rows = []
+        for t in threads:
+            rows.append((t['id'], t['href'], t['category'], t['subcategory'], t['last_post'], t['answers'], json.dumps(t), folder+"{}{}".format(t['id'], extension)))
+
+        with self.lock:
+            self.db.execute("BEGIN")
+            try:
+                self.db.executemany("""INSERT INTO threads (id, href, category, subcategory, last_post, answers, listing, file) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(id) DO UPDATE SET href=excluded.href, category=excluded.category, subcategory=excluded.subcategory,
+                    last_post=excluded.last_post, answers=excluded.answers, listing=excluded.listing, file=excluded.file""", rows)
+                self.db.execute("COMMIT")
+            except:
+                self.db.execute("ROLLBACK")
+                raise
+
+    def put_mined(self, thread_id, header): # header of threads/<id>.json after mining
+        with self.lock:
+            self.db.execute("UPDATE threads SET status=?, total_pages=?, total_posts=?, mined_last_post=?, mined_answers=? WHERE id=?",
+                (header.get('status'), header.get('total_pages'), header.get('total_posts'), header.get('last_post'), header.get('answers'), thread_id))
+
+    def summary(self):
+        with self.lock:
+            row = self.db.execute("""SELECT
+                (SELECT COUNT(*) FROM subcategories),
+                (SELECT COUNT(*) FROM threads),
+                (SELECT COUNT(*) FROM threads WHERE status='complete'),
+                (SELECT COALESCE(SUM(total_posts), 0) FROM threads)""").fetchone()
+        return {'subcategories': row[0], 'threads': row[1], 'threads_complete': row[2], 'posts': row[3]}
+
+    def pending_condition(self, force): # threads new, not complete, or whose listing changed since mined
+        if force:
+            return "1"
+        return "(status IS NULL OR status!='complete' OR mined_last_post IS NOT last_post OR mined_answers IS NOT answers)"
+
+    def count_pending(self, force=False):
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*) FROM threads WHERE "+self.pending_condition(force)).fetchone()[0]
+
+    def pending_threads(self, force=False, batch=1000): # generator of listing rows. Keyset pagination by id
+        last_id = -1
+        while True:
+            with self.lock:
+                rows = self.db.execute("SELECT id, listing FROM threads WHERE id>? AND "+self.pending_condition(force)+" ORDER BY id LIMIT ?", (last_id, batch)).fetchall()
+            if len(rows)==0:
+                return
+            for row in rows:
+                yield json.loads(row[1])
+            last_id = rows[-1][0]
+
+    def close(self):
+        with self.lock:
+            self.db.close()
@@ -1,25 +1,33 @@
 import argparse
 import json
 import os
-from bs4 import BeautifulSoup
-import re
 from urllib.parse import urlparse
 import sys
 import pandas as pd
 import threading
-import time
 import numpy as np
 import seaborn as sns
 import matplotlib.pyplot as plt
 import matplotlib.patheffects as path_effects
 import nltk
 import datetime
+import hashlib
 import logging
 import traceback
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from scheduler import Scheduler
+from thread_store import ThreadStore
+from serializer import write_atomic
+from post_converter import PostConverter
+from conversations import ReplyGraph
+from message_cache import MessageCache
+
+CACHE_VERSION = 1 # change when the cleaning changes, entries of clear_cache.sqlite are dropped
 
 class Cleaner:
 
-    def __init__(self, url, min_l, max_l, conversations, cache, threads, only_empty_msgs):
+    def __init__(self, url, min_l, max_l, conversations, cache, threads, only_empty_msgs, processes=0, batch_size=20, max_conversations=None, max_depth=None, full=False):
         self.base_url = url
         self.domain = urlparse(self.base_url).netloc
         self.min = min_l
@@ -29,8 +37,12 @@ class Cleaner:
         self.max_threads = threads
         self.tokenizer = nltk.tokenize.TweetTokenizer()
         self.only_empty_msgs = only_empty_msgs
-
-        self.cache_identify_conversations = {}
+        self.processes = processes # 0 cleans with self.max_threads threads, otherwise with this many processes
+        self.batch_size = batch_size # threads sent to a process at once
+        self.max_conversations = max_conversations # conversations of a thread, None for all
+        self.max_depth = max_depth # posts of a conversation, None for all
+        self.full = full # clean every message again instead of reading clear_cache.sqlite
+        self.infos_rows = None # thread id -> row of self.infos
 
         # folders to work
         self.config_folder     = "./config/{}/".format(self.domain) # must exist
@@ -38,6 +50,8 @@ class Cleaner:
         self.result_folder     = self.config_folder+"clear_threads/" # must be created
         self.plots_folder     = self.config_folder+"plots/" # must be created
         self.clear_cache_file  = self.config_folder+"clear_cache.csv"
+        self.message_cache_file = self.config_folder+"clear_cache.sqlite"
+        self.thread_store      = ThreadStore(self.threads_folder)
 
         # locks
         self.lock_alter_infos = threading.Lock()
@@ -79,6 +93,10 @@ class Cleaner:
             "code": " <code> {} </code> ",
             "iframe": " <iframe> {} </iframe> ",
         }
+        self.converter = PostConverter(self.tags) # same output of limpar_post (tests/reference_cleaner.py) in a single walk
+
+        version = json.dumps([CACHE_VERSION, self.tags, self.punctuation]) # what the cleaned text and token counts depend on
+        self.message_cache = MessageCache(self.message_cache_file, version)
 
     def load_infos(self):
 
@@ -96,7 +114,7 @@ class Cleaner:
 
         if load_all:
             print("Reading threads from {}".format(self.threads_folder))
-            files = [os.path.join(dp, f) for dp, dn, filenames in os.walk(self.threads_folder) for f in filenames if os.path.splitext(f)[1] == '.json']
+            files = self.thread_store.list_ids()
 
             dats = []
             ids = []
@@ -106,26 +124,25 @@ class Cleaner:
             dates = []
             updates = []
             for f in files:
-                with open(f, "r") as f:
-                    try:
-                        dat = json.loads(f.read())
-                    except:
-                        print("File {} malformed. Skipped.".format(f))
-                        continue
-                    dats.append({
-                        "id": dat['id'],
-                        "category": dat['category'],
-                        "subcategory": dat['subcategory'],
-                        "total_messages": len(dat['messages']),
-                        "date_thread": dat['date_thread'],
-                        "last_update": dat['last_update'],
-                        })
-                    ids.append(dat['id'])
-                    categories.append(dat['category'])
-                    subcategories.append(dat['subcategory'])
-                    total_messages.append(len(dat['messages']))
-                    dates.append(dat['date_thread'])
-                    updates.append(dat['last_update'])
+                try:
+                    dat = self.thread_store.load(f)
+                except:
+                    print("File {} malformed. Skipped.".format(f))
+                    continue
+                dats.append({
+                    "id": dat['id'],
+                    "category": dat['category'],
+                    "subcategory": dat['subcategory'],
+                    "total_messages": len(dat['messages']),
+                    "date_thread": dat['date_thread'],
+                    "last_update": dat['last_update'],
+                    })
+                ids.append(dat['id'])
+                categories.append(dat['category'])
+                subcategories.append(dat['subcategory'])
+                total_messages.append(len(dat['messages']))
+                dates.append(dat['date_thread'])
+                updates.append(dat['last_update'])
 
             self.infos = pd.DataFrame({
                 'id': ids,
@@ -138,281 +155,121 @@ class Cleaner:
 
             self.save_infos()
 
-    def limpar_post(self, post_bs):
-        if type(post_bs)==str:
-            post_bs = BeautifulSoup(post_bs, features="lxml")
-
-        for el in post_bs.find_all('div', class_="kl_amdp_merge_message"): # remove mensagem de post duplo
-            el.extract()
-
-            
-        for el in post_bs.find_all('br'): # remove mensagem de post duplo
-            el.extract()
-
-        iframes = post_bs.find_all('iframe')
-        for iframe in iframes: # detecta iframes
-            domain = urlparse(iframe['src']).netloc
-            insert = self.tags['iframe'].format(domain)
-            iframe.insert_after(insert)
-            iframe.extract()
-
-
-        bbcodeblockscode = post_bs.find_all('div', class_="bbCodeBlock--code")
-        for bbcodeblockcode in bbcodeblockscode: # detecta codes
-            insert = self.tags['code'].format(self.to_single_line(bbcodeblockcode.find('code').text))
-            bbcodeblockcode.insert_after(insert)
-            bbcodeblockcode.extract()
-
-
-        bbcodeblocks = post_bs.find_all('div', class_="bbCodeBlock")
-        for bbcodeblock in bbcodeblocks: # detecta shared contents
-            ok = False
-            try:
-                data_host = bbcodeblock['data-host']
-
-                title = bbcodeblock.find_all('a')[0].getText()
-                ok = True
-            except:
-                pass
-
-            if ok:
-                insert = self.tags['shared_content'].format(data_host, title)
-
-                bbcodeblock.insert_after(insert)
-
-                bbcodeblock.extract()
-
-        for img in post_bs.find_all('img'): # detecta images
-            overwrite_with = ""
-            if img.has_attr('class'):
-                if 'bbImage' in img['class']:
-                    overwrite_with = self.tags['external_image']
-                elif 'smilie' in img['class']:
-                    overwrite_with = self.tags['emoji'].format(img['alt'])
-                else:
-                    overwrite_with = self.tags['img_unknown']
-            else:
-                overwrite_with = self.tags['img_unknown']
-
-            img.insert_after(overwrite_with)
-            img.unwrap()
-
-        for a in post_bs.find_all('a'): # detecta links
-
-            try:
-                text = a.getText()
-                domain = urlparse(a['href']).netloc
-                text = re.sub('(http:\/\/\S+|https:\/\/\S+)', self.tags['link'], text, flags=re.MULTILINE)
-                insert = self.tags['url'].format(domain, text)
-                a.insert_after(insert)
-            except:
-                pass
-
-            a.extract()
-
-        for span in post_bs.find_all('span'): # detect videos
-            try:
-                source = span['data-s9e-mediaembed']
-
-                insert = self.tags['mediaembed'].format(source)
-
-                span.insert_after(insert)
-
-                span.extract()
-            except:
-                pass
-
-        quotes = post_bs.find_all('blockquote') # remove quotes
-        quotes = quotes[::-1]
-        for quote in quotes:
-            title = quote.find('div', class_="bbCodeBlock-title")
-            content = quote.find('div', class_="bbCodeBlock-content")
-            if title==None:
-                insert = self.tags['quote'].format(self.limpar_post(content))
-
-                quote.insert_after(insert)
-            quote.extract() # THIS WILL REMOVE ALL QUOTES AFTER IDENTIFIED
-
-        spoilers = post_bs.find_all('div', class_='bbCodeSpoiler')
-        spoilers = spoilers[::-1]
-        for spoiler in spoilers:
-            insert = self.tags['spoiler'].format(self.limpar_post(spoiler))
-            spoiler.insert_after(insert)
-            spoiler.extract()
-
-        res = post_bs.text
-        res = res.strip()
-        res = res.replace("\n", " ")
-        res = res.replace("\r", " ")
-        res = res.replace("\t", " ")
-        res = re.sub(r' +', ' ', res)
-        res = re.sub(u"\u200b", ' ', res)
-        res = re.sub(u'\xa0', ' ', res)
-        return res
-
-    def identify_conversations(self, msg, thread_id, msg_id):
-        try:
-            return self.cache_identify_conversations[thread_id][msg_id] # cache mechanism
-        except:
-            pass
-        
-        msg = BeautifulSoup(msg, features="lxml")
-
-        quotes = msg.find_all("blockquote", class_="bbCodeBlock--quote")
-        res = []
-
-        for quote in quotes:
-            title = msg.find_all("div", class_="bbCodeBlock-title")
-            for t in title:
-                if t.a!=None:
-                    try:
-                        res.append(t.a['data-content-selector'])
-                    except:
-                        pass
-
-        res = list(set(res))
-        res.sort()
-        
-        self.cache_identify_conversations[thread_id][msg_id] = res
-        return res
-
-    def mount_conversation(self, thread_id, orig, dat, index_message, res_final):
-        try:
-            index_message["#"+orig['official_id']]
-        except:
-            return res_final
-
-        cs = self.identify_conversations(orig['message'], thread_id, orig['official_id'])
-
-        try:
-            orig['parent']
-        except:
-            orig['parent'] = None
-        
-        for c in cs:
-            
-            check_repeated = orig
-            can_continue = True
-            while check_repeated!=None:
-                if c=="#"+check_repeated['official_id']:
-                    can_continue = False
-                    break
-                check_repeated = check_repeated['parent']
-            
-            if can_continue:
-                try:
-                    idx = index_message[c]
-                    next_message = dat['messages'][idx]
-                except:
-                    continue
-                if next_message['isodate']<orig['isodate']: # avoid timetravel response
-                    next_message['parent'] = orig
-                    res_final = self.mount_conversation(thread_id, next_message, dat, index_message, res_final)
-
-        if len(cs)==0:
-            r = []
-            while orig['parent']!=None:
-                idx = index_message["#"+orig['official_id']]
-                r.append(dat['messages'][idx])
-                orig = orig['parent']
-
-            idx = index_message["#"+orig['official_id']]
-            r.append(dat['messages'][idx])
-
-            if len(r)>1:
-                res_final.append(r)
-
-        return res_final
-
-    def to_single_line(self, s):
-        s = s.replace("\r", " ")
-        return s.replace("\n", " ")
-
     def do_process(self, th):
         logging.info("Starting thread {}".format(th.id))
         try:
-            dat = None
-            with open(self.threads_folder+"{}.json".format(th['id']), 'r') as f:
-                dat = f.read()
-                f.close()
-                dat = json.loads(dat)
-
-            index_message = {}
-
-            for i in range(len(dat['messages'])):
-                idd = "#{}".format(dat['messages'][i]['official_id'])
-                index_message[idd] = i
+            tokens_lens, conversations_lens = self.clean_thread(th['id'])
+            self.set_infos(th['id'], "tokens_lens", tokens_lens)
+            self.set_infos(th['id'], "conversations_lens", conversations_lens)
+        except Exception as e:
+            logging.error("EXCEPTION thread.id={}, {}".format(th.id, traceback.format_exc().replace("\n","")))
 
-                isodate = dat['messages'][i]['creation']
-                isodate = isodate[0:22]+":"+isodate[22:]
-                dat['messages'][i]['isodate'] = datetime.datetime.fromisoformat(isodate)
+    def clean_batch(self, ids): # run by a worker process. Returns (id, tokens_lens, conversations_lens), lens are None on error
+        res = []
+        for thread_id in ids:
+            logging.info("Starting thread {}".format(thread_id))
+            try:
+                tokens_lens, conversations_lens = self.clean_thread(thread_id)
+            except Exception as e:
+                logging.error("EXCEPTION thread.id={}, {}".format(thread_id, traceback.format_exc().replace("\n","")))
+                tokens_lens, conversations_lens = None, None
+            res.append((thread_id, tokens_lens, conversations_lens))
+        return res
 
-            tokens_lens = []
+    def count_tokens(self, message_clear):
+        txt = message_clear+""
+        for p in self.punctuation:
+            txt = txt.replace(p, " ")
+        return len(self.tokenizer.tokenize(txt))
+
+    def thread_signature(self, keys, dat): # changes when the files of the thread would change
+        h = hashlib.sha1(json.dumps([self.conversations, self.max_conversations, self.max_depth]).encode("utf-8"))
+        for i in range(len(dat['messages'])):
+            m = dat['messages'][i]
+            h.update("{}\t{}\t{}\n".format(keys[i], m['creation'], m['user_name']).encode("utf-8"))
+        return h.hexdigest()
+
+    def clean_thread(self, thread_id): # writes the files of the thread. Returns (tokens_lens, conversations_lens)
+        dat = self.thread_store.load(thread_id)
+
+        keys = [self.message_cache.key(m['message']) for m in dat['messages']]
+        signature = self.thread_signature(keys, dat)
+        cached = {}
+        if not self.full:
+            last = self.message_cache.thread(thread_id)
+            if last!=None and last[0]==signature and os.path.isfile(self.result_folder+"{}.tsv".format(thread_id)): # files already written
+                logging.info("Thread {} unchanged".format(thread_id))
+                return last[1], last[2]
+            cached = self.message_cache.get_many(keys)
+
+        for i in range(len(dat['messages'])):
+            isodate = dat['messages'][i]['creation']
+            isodate = isodate[0:22]+":"+isodate[22:]
+            dat['messages'][i]['isodate'] = datetime.datetime.fromisoformat(isodate)
+
+        tokens_lens = []
+        new_messages = [] # (key, text, tokens, targets) to cache
+        for i in range(0, len(dat['messages']), 1):
+            m = dat['messages'][i]
+            if keys[i] in cached:
+                m['message_clear'], tokens, m['quote_targets'] = cached[keys[i]]
+            else: # quoted posts are found in the same parse, so the cache serves runs with and without -c
+                m['message_clear'], m['quote_targets'] = self.converter.extract(m['message'])
+                tokens = self.count_tokens(m['message_clear'])
+                cached[keys[i]] = (m['message_clear'], tokens, m['quote_targets'])
+                new_messages.append((keys[i], m['message_clear'], tokens, m['quote_targets']))
+
+            tokens_lens.append(tokens)
+
+        self.message_cache.put_many(new_messages)
+
+        with open(self.result_folder+"{}.tsv".format(thread_id), 'w') as f:
             for i in range(0, len(dat['messages']), 1):
-                dat['messages'][i]['message_clear'] = self.limpar_post(dat['messages'][i]['message'])
-
-                txt = dat['messages'][i]['message_clear']+""
-                for p in self.punctuation:
-                    txt = txt.replace(p, " ")
-
-                tokens_lens.append(len(self.tokenizer.tokenize(txt)))
-
-
-
-            with open(self.result_folder+"{}.tsv".format(th['id']), 'w') as f:
-                for i in range(0, len(dat['messages']), 1):
+                txt = ''
+                if i>0:
+                    txt += "\n"
+                txt += "{}\t{}\t{}".format(dat['messages'][i]['creation'], dat['messages'][i]['user_name'], dat['messages'][i]['message_clear'])
+                f.write(txt)
+
+
+        conversations_lens = []
+        counter_conversation = -1
+        if self.conversations:
+            graph = ReplyGraph(dat['messages']) # who each post is replying, see tests/reference_cleaner.py mount_conversation
+            for c in graph.conversations(self.max_conversations, self.max_depth):
+                conversations_lens.append(len(c))
+                counter_conversation += 1
+
+                with open(self.result_folder+"{}_{}.tsv".format(thread_id, counter_conversation), 'w') as f:
                     txt = ''
-                    if i>0:
-                        txt += "\n"
-                    txt += "{}\t{}\t{}".format(dat['messages'][i]['creation'], dat['messages'][i]['user_name'], dat['messages'][i]['message_clear'])
-                    f.write(txt)
-
-
-            conversations_lens = []
-            counter_conversation = -1
-            if self.conversations:
-                self.cache_identify_conversations[th['id']] = {}
-                for i in range(len(dat['messages'])-1, -1, -1):
-                    post = dat['messages'][i]
-
-                    convs = self.mount_conversation(th['id'], post, dat, index_message, []) # identify who this post is replying and which part
-
-                    for c in convs:
-                        conversations_lens.append(len(c))
-                        counter_conversation += 1
-
-                        with open(self.result_folder+"{}_{}.tsv".format(th['id'], counter_conversation), 'w') as f:
-                            txt = ''
-                            for ii in range(len(c)):
-                                if ii>0:
-                                    txt += "\n"
-                                cc = c[ii]
-                                txt += "{}\t{}\t{}".format(cc['creation'], cc['user_name'], cc['message_clear'])
-
-                            f.write(txt)
+                    for ii in range(len(c)):
+                        if ii>0:
+                            txt += "\n"
+                        cc = c[ii]
+                        txt += "{}\t{}\t{}".format(cc['creation'], cc['user_name'], cc['message_clear'])
 
+                    f.write(txt)
 
-                    for conv in convs:
-                        for m in conv:
-                            try:
-                                del( index_message["#"+m['official_id']] )
-                            except:
-                                continue
-                self.cache_identify_conversations[th['id']] = {}
+        counter_conversation += 1
+        while self.conversations and os.path.isfile(self.result_folder+"{}_{}.tsv".format(thread_id, counter_conversation)): # conversations of a previous version of the thread
+            os.remove(self.result_folder+"{}_{}.tsv".format(thread_id, counter_conversation))
+            counter_conversation += 1
 
-            self.set_infos(th, "tokens_lens", tokens_lens)
-            self.set_infos(th, "conversations_lens", conversations_lens)
-        except Exception as e:
-            logging.error("EXCEPTION thread.id={}, {}".format(th.id, traceback.format_exc().replace("\n","")))
+        self.message_cache.set_thread(thread_id, signature, tokens_lens, conversations_lens) # after the files, an interrupted thread is written again
+        return tokens_lens, conversations_lens
 
-    def set_infos(self, th, key, value):
+    def set_infos(self, thread_id, key, value):
         self.lock_alter_infos.acquire()
 
         try:
             if not key in self.infos.columns:
                 self.infos[key] = [None]*len(self.infos)
+            if self.infos[key].dtype!=object: # column read from the cache file with only nan
+                self.infos[key] = self.infos[key].astype(object)
 
-            self.infos.loc[self.infos['id']==th['id'], key] = json.dumps(value)
+            if self.infos_rows==None:
+                self.infos_rows = dict(zip(self.infos['id'], self.infos.index))
+            self.infos.at[self.infos_rows[thread_id], key] = json.dumps(value)
 
         except Exception as e:
             print(e)
@@ -421,7 +278,7 @@ class Cleaner:
 
     def save_infos(self):
         self.lock_alter_infos.acquire()
-        self.infos.to_csv(self.clear_cache_file, sep='\t', index=False)
+        write_atomic(self.clear_cache_file, self.infos.to_csv(sep='\t', index=False))
         self.lock_alter_infos.release()
 
     def process(self):
@@ -438,31 +295,69 @@ class Cleaner:
         save_every = len(sub)//200 # to save every 0.5%
         save_every = max(1, save_every)
 
-        threads_running = []
-        for i in range(len(sub)):
-            th = sub.iloc[i]
-            print("id={}\t{}/{} = {}%".format( th.id, i+1, len(sub), round((i/float(len(sub)))*100,1) ) )#, end='\r')
+        def tasks():
+            for i in range(len(sub)):
+                th = sub.iloc[i]
+                print("id={}\t{}/{} = {}%".format( th.id, i+1, len(sub), round((i/float(len(sub)))*100,1) ) )#, end='\r')
 
+                yield self.do_process, (th,)
 
-            x = threading.Thread(target=self.do_process, args=(th,))
-            threads_running.append(x)
-            x.start()
+                if i%save_every==0:
+                    self.save_infos()
 
-            while True:
-                threads_running = [thread for thread in threads_running if thread.is_alive()]
+        if self.processes>0:
+            self.process_pool(sub, save_every)
+            return
 
-                if len(threads_running)<self.max_threads:
-                    break
-                time.sleep(0.01)
+        try:
+            Scheduler(self.max_threads, "cleaner").run(tasks())
+        finally:
+            self.save_infos()
 
-            if i%save_every==0:
-                self.save_infos()
+    def process_pool(self, sub, save_every): # batches of threads cleaned by processes. Only this process changes self.infos
+        ids = [int(x) for x in sub['id']]
+        batches = [ids[i:i+self.batch_size] for i in range(0, len(ids), self.batch_size)]
+        logging.info("Cleaning with {} processes, {} batches".format(self.processes, len(batches)))
 
-        print("Main loop complete. Waiting for final threads")
-        for x in threads_running:
-            x.join()
+        args = (self.base_url, self.min, self.max, self.conversations, self.cache, 1, self.only_empty_msgs, 0, self.batch_size, self.max_conversations, self.max_depth, self.full)
+        pool = ProcessPoolExecutor(self.processes, mp_context=multiprocessing.get_context("spawn"), initializer=init_worker, initargs=(args,))
+        pending = set()
+        done = 0
+        saved = 0
+        try:
+            for batch in batches:
+                if len(pending)>=self.processes*2: # keep a few batches queued, not all of them
+                    finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    done += self.collect(finished, len(ids), done)
+                pending.add(pool.submit(clean_batch, batch))
+
+                if done-saved>=save_every:
+                    saved = done
+                    self.save_infos()
+
+            while len(pending)>0:
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                done += self.collect(finished, len(ids), done)
+        except KeyboardInterrupt:
+            for future in pending:
+                future.cancel()
+            print("\nInterrupted. Waiting for running batches to finish...")
+            raise
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+            self.save_infos()
 
-        self.save_infos()
+    def collect(self, futures, total, done): # results of finished batches into self.infos. Returns the amount of threads
+        amount = 0
+        for future in futures:
+            for thread_id, tokens_lens, conversations_lens in future.result():
+                amount += 1
+                print("id={}\t{}/{} = {}%".format(thread_id, done+amount, total, round(((done+amount)/float(total))*100,1)))
+                if tokens_lens==None: # error logged by the worker
+                    continue
+                self.set_infos(thread_id, "tokens_lens", tokens_lens)
+                self.set_infos(thread_id, "conversations_lens", conversations_lens)
+        return amount
 
     def plots(self):
 
@@ -534,7 +429,18 @@ class Cleaner:
         plt.savefig(self.plots_folder+"line_numberpost_per_thread.pdf", bbox_inches='tight', pad_inches=0)
         plt.close()
 
-def main(url, min_l, max_l, conversations, cache, threads, plots, only_empty_msgs):
+worker_cleaner = None # Cleaner of each worker process
+
+def init_worker(args):
+    global worker_cleaner
+    FORMAT = '%(asctime)s %(levelname)s %(funcName)s %(processName)s - \t %(message)s'
+    logging.basicConfig(filename='log_cleaner.log', filemode='a', format=FORMAT, level=logging.INFO)
+    worker_cleaner = Cleaner(*args)
+
+def clean_batch(ids):
+    return worker_cleaner.clean_batch(ids)
+
+def main(url, min_l, max_l, conversations, cache, threads, plots, only_empty_msgs, processes, batch_size, max_conversations, max_depth, full):
     args = locals()
     print("Starting")
     FORMAT = '%(asctime)s %(levelname)s %(funcName)s %(threadName)s - \t %(message)s'
@@ -543,7 +449,7 @@ def main(url, min_l, max_l, conversations, cache, threads, plots, only_empty_msg
     logging.info('Starting')
     logging.info(str(args))
 
-    cleaner = Cleaner(url, min_l, max_l, conversations, cache, threads, only_empty_msgs)
+    cleaner = Cleaner(url, min_l, max_l, conversations, cache, threads, only_empty_msgs, processes, batch_size, max_conversations, max_depth, full)
     cleaner.load_infos()
 
     if plots:
@@ -561,9 +467,18 @@ if __name__ == "__main__":
     ap.add_argument("-c", "--conversations", required=False, action="store_true", help="If present, all conversations will generate a different file")
     ap.add_argument("-ca", "--cache", required=False, action="store_true", help="If present, cache file will be created and used")
     ap.add_argument("-t", "--threads", required=False, type=int, help="Total of threads to create", default=1)
+    ap.add_argument("-pr", "--processes", required=False, type=int, help="Clean with this many processes instead of -t threads. Cleaning is CPU bound, so threads do not run in parallel", default=0)
+    ap.add_argument("-bs", "--batch-size", required=False, type=int, help="With -pr, threads sent to a process at once", default=20)
+    ap.add_argument("-mc", "--max-conversations", required=False, type=int, help="With -c, conversations written for a thread. All of them if not present", default=None)
+    ap.add_argument("-md", "--max-depth", required=False, type=int, help="With -c, posts of a conversation. Longer ones are cut. All of them if not present", default=None)
+    ap.add_argument("-f", "--full", required=False, action="store_true", help="Clean every message again, ignoring the cleaned messages and threads in clear_cache.sqlite")
     ap.add_argument("-p", "--plots", required=False, action="store_true", help="If present, the plots will be generated. No processing is done")
     ap.add_argument("-oem", "--only_empty_msgs", required=False, action="store_true", help="Only process threads where conversations_lens==nan")
 
     args = vars(ap.parse_args())
 
-    main(args['url'], args['min'], args['max'], args['conversations'], args['cache'], args['threads'], args['plots'], args['only_empty_msgs'])
\ No newline at end of file
+    try:
+        main(args['url'], args['min'], args['max'], args['conversations'], args['cache'], args['threads'], args['plots'], args['only_empty_msgs'], args['processes'], args['batch_size'], args['max_conversations'], args['max_depth'], args['full'])
+    except KeyboardInterrupt:
+        print("Interrupted")
+        logging.warning("Interrupted by the user")
\ No newline at end of file
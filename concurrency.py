@@ -0,0 +1,104 @@
+import logging
+import threading
+import time
+from rate_limiter import THROTTLE_STATUS
+
+
+class AIMDController: # additive increase / multiplicative decrease of the requests in flight
+
+    def __init__(self, floor, ceiling, error_threshold=0.05, latency_factor=2.0, latency_slack=0.1):
+        self.floor = max(1, floor)
+        self.ceiling = max(self.floor, ceiling)
+        self.limit = float(self.floor) # slow start from the floor
+        self.error_threshold = error_threshold # error rate in a window that triggers a decrease
+        self.latency_factor = latency_factor # window median above baseline*factor triggers a decrease
+        self.latency_slack = latency_slack # seconds. Ignore latency growth smaller than this (fast local hosts)
+
+        self.in_flight = 0
+        self.baseline_latency = None # lowest window median seen
+
+        self.window_latencies = []
+        self.window_errors = 0
+        self.window_throttled = 0
+
+        # locks
+        self.condition = threading.Condition()
+
+    def current_limit(self):
+        return int(self.limit)
+
+    def acquire(self): # blocks while the limit is reached
+        with self.condition:
+            while self.in_flight>=self.current_limit():
+                self.condition.wait()
+            self.in_flight += 1
+
+    def release(self):
+        with self.condition:
+            self.in_flight -= 1
+            self.condition.notify()
+
+    def record(self, latency, error=False, throttled=False): # called after every request
+        with self.condition:
+            self.window_latencies.append(latency)
+            if error:
+                self.window_errors += 1
+            if throttled:
+                self.window_throttled += 1
+
+            if len(self.window_latencies)>=max(10, self.current_limit()) or throttled:
+                self.adjust()
+
+    def adjust(self): # caller holds self.condition
+        samples = len(self.window_latencies)
+        latencies = sorted(self.window_latencies)
+        median = latencies[samples//2]
+        error_rate = self.window_errors/float(samples)
+
+        if self.baseline_latency==None or median<self.baseline_latency:
+            self.baseline_latency = median
+
+        old = self.limit
+        reason = None
+        if self.window_throttled>0:
+            self.limit = self.limit*0.5
+            reason = "throttled"
+        elif error_rate>self.error_threshold:
+            self.limit = self.limit*0.75
+            reason = "error rate {:.2f}".format(error_rate)
+        elif median>self.baseline_latency*self.latency_factor and median-self.baseline_latency>self.latency_slack:
+            self.limit = self.limit*0.75
+            reason = "latency {:.2f}s (baseline {:.2f}s)".format(median, self.baseline_latency)
+        else:
+            self.limit = self.limit+1
+            reason = "healthy, latency {:.2f}s".format(median)
+
+        self.limit = min(max(self.limit, self.floor), self.ceiling)
+
+        self.window_latencies = []
+        self.window_errors = 0
+        self.window_throttled = 0
+
+        if int(old)!=self.current_limit():
+            logging.info("Autotune max_request {} -> {} ({})".format(int(old), self.current_limit(), reason))
+            self.condition.notify_all()
+
+
+class RequestSlot: # with-statement helper used around every network request of the threaded engine
+
+    def __init__(self, controller):
+        self.controller = controller
+        self.started = None
+
+    def __enter__(self):
+        if self.controller!=None:
+            self.controller.acquire()
+        self.started = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.controller!=None:
+            self.controller.release()
+            throttled = getattr(exc, 'status', None) in THROTTLE_STATUS
+            self.controller.record(time.time()-self.started, error=exc!=None, throttled=throttled)
+        return False
@@ -0,0 +1,95 @@
+import logging
+
+
+class ReplyGraph: # quotes of a thread as a graph. Conversations are the paths from a post to a post quoting nobody
+    # Nodes are the positions of the messages. A message has an edge to each post it quotes that is older than it,
+    # in the order of its quote_targets. Same conversations, in the same order, of the original mount_conversation,
+    # which is kept as reference in tests/reference_cleaner.py (compare them with python benchmark.py conversations). Paths are enumerated
+    # with an explicit stack, so long chains do not hit the recursion limit, and posts whose quotes lead to no
+    # conversation are remembered, so they are not explored again through every path that reaches them.
+
+    def __init__(self, messages):
+        self.messages = messages
+
+        position = {} # "#<official_id>" -> position, as the index_message of the cleaner
+        for i in range(len(messages)):
+            position["#{}".format(messages[i]['official_id'])] = i
+
+        self.edges = []
+        self.leaf = [] # quotes nobody. Conversations end on it
+        for i in range(len(messages)):
+            targets = messages[i]['quote_targets']
+            edges = []
+            for t in targets:
+                j = position.get(t)
+                if j!=None and messages[j]['isodate']<messages[i]['isodate']: # avoid timetravel response
+                    edges.append(j)
+            self.edges.append(edges)
+            self.leaf.append(len(targets)==0)
+
+    def conversations(self, max_conversations=None, max_depth=None): # lists of messages, the last post first
+        # Posts are taken from the last to the first. Posts already in a conversation do not start or continue others.
+        # max_conversations stops the thread after that many. Paths reaching max_depth posts end there.
+        total = len(self.messages)
+        self.alive = [True]*total # not in a conversation yet
+        self.dead = set() # no conversation starts from it, see dead_key
+        self.remaining = max_conversations
+        self.max_depth = max_depth
+
+        for root in range(total-1, -1, -1):
+            if not self.alive[root]:
+                continue
+
+            used = set() # removed only after every conversation of root, as the index_message of the cleaner
+            for path in self.paths(root, max_depth):
+                used.update(path)
+                yield [self.messages[i] for i in reversed(path)]
+
+            for i in used:
+                self.alive[i] = False
+
+            if self.remaining==0:
+                logging.warning("Conversations limited to {}".format(max_conversations))
+                return
+
+    def dead_key(self, node, depth): # with max_depth, a post may end a conversation deep in the path and lead to none near the root
+        if self.max_depth==None:
+            return node
+        return (node, depth)
+
+    def paths(self, root, max_depth): # conversations starting on root, depth first. Their count may grow exponentially, so they are not kept
+        if self.leaf[root]: # a single post is not a conversation
+            return
+
+        path = [root]
+        positions = [0] # next edge of each node of path
+        found = [False] # a conversation passes through each node of path
+        while len(path)>0:
+            node = path[-1]
+            edges = self.edges[node]
+            if positions[-1]<len(edges) and self.remaining!=0:
+                child = edges[positions[-1]]
+                positions[-1] += 1
+                if not self.alive[child] or self.dead_key(child, len(path)+1) in self.dead:
+                    continue
+
+                if self.leaf[child] or (max_depth!=None and len(path)+1>=max_depth):
+                    found[-1] = True
+                    if self.remaining!=None:
+                        self.remaining -= 1
+                    yield path+[child]
+                    continue
+
+                path.append(child)
+                positions.append(0)
+                found.append(False)
+                continue
+
+            depth = len(path)
+            path.pop()
+            positions.pop()
+            if found.pop():
+                if len(found)>0:
+                    found[-1] = True
+            elif self.remaining!=0: # every path from it was explored. No post of the thread will reach a leaf through it at this depth
+                self.dead.add(self.dead_key(node, depth))
@@ -0,0 +1,210 @@
+import argparse
+import hashlib
+import random
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WORDS = ["forum", "thread", "post", "reply", "quote", "member", "topic", "question", "answer", "thanks", "problem", "solution", "update", "version", "today"]
+
+
+class Forum: # synthetic XenForo forum. Pages have the markup read by parsers.py and MinerXenForo.py
+
+    def __init__(self, categories=1, subs=2, threads=30, posts=45, threads_per_page=20, posts_per_page=20, post_words=20, seed=1):
+        self.threads_per_page = threads_per_page
+        self.posts_per_page = posts_per_page
+        self.post_words = post_words # size of each post body
+        self.rnd = random.Random(seed)
+        self.start = datetime(2021, 1, 1, 10, 0, 0)
+        self.categories = []
+        self.threads = {}
+
+        thread_id = 0
+        for c in range(categories):
+            category = {'id': c, 'subs': []}
+            for s in range(subs):
+                sub = {'id': c*100+s, 'threads': []}
+                for t in range(threads):
+                    thread_id += 1
+                    amount = self.rnd.randint(1, posts) # posts of the thread
+                    thread = {'id': thread_id, 'sub': sub['id'], 'posts': [self.make_post(thread_id, i) for i in range(amount)]}
+                    self.threads[thread_id] = thread
+                    sub['threads'].append(thread)
+                category['subs'].append(sub)
+            self.categories.append(category)
+
+    def make_post(self, thread_id, i, when=None):
+        if when==None:
+            when = self.start+timedelta(minutes=thread_id*7+i*61)
+        body = " ".join(self.rnd.choice(WORDS) for w in range(self.post_words))
+        return {'id': thread_id*100000+i, 'user': (thread_id+i)%17, 'when': when, 'body': 'Post {} of thread {} <b>{}</b>'.format(i, thread_id, body)}
+
+    def add_posts(self, thread_id, amount, when): # new answers to a thread, from when on
+        thread = self.threads[thread_id]
+        for i in range(amount):
+            thread['posts'].append(self.make_post(thread_id, len(thread['posts']), when+timedelta(minutes=i)))
+
+    def format_date(self, d):
+        return d.strftime("%Y-%m-%dT%H:%M:%S")+"-0300"
+
+    def page_nav(self, base, page, total):
+        if total<=1:
+            return ""
+        pages = "".join('<li><a href="{}page-{}">{}</a></li>'.format(base, p, p) for p in range(1, total+1))
+        next_page = ""
+        if page<total:
+            next_page = '<a class="pageNav-jump pageNav-jump--next" href="{}page-{}">Next</a>'.format(base, page+1)
+        return '<nav class="pageNav"><ul class="pageNav-main">{}</ul>{}</nav>'.format(pages, next_page)
+
+    def home(self):
+        out = ['<html><body><div class="p-body-pageContent">']
+        for category in self.categories:
+            out.append('<div class="block block--category"><h2 class="block-header"><a href="/categories/c.{}/">Category {}</a></h2><div class="block-body">'.format(category['id'], category['id']))
+            for sub in category['subs']:
+                out.append('<div class="node"><h3 class="node-title"><a href="/forums/f.{}/">Forum {}</a></h3><div class="node-description">About {}</div></div>'.format(sub['id'], sub['id'], sub['id']))
+            out.append('</div></div>')
+        out.append('</div></body></html>')
+        return "".join(out)
+
+    def listing(self, sub_id, page):
+        sub = None
+        for category in self.categories:
+            for s in category['subs']:
+                if s['id']==sub_id:
+                    sub = s
+        if sub==None:
+            return None
+
+        threads = sorted(sub['threads'], key=lambda t: t['posts'][-1]['when'], reverse=True) # last answered first
+        total = max(1, (len(threads)+self.threads_per_page-1)//self.threads_per_page)
+        base = "/forums/f.{}/".format(sub_id)
+        out = ['<html><body>', self.page_nav(base, page, total), '<div class="structItemContainer"><div class="structItemContainer-group js-threadList">']
+        for t in threads[(page-1)*self.threads_per_page:page*self.threads_per_page]:
+            first = t['posts'][0]
+            out.append('<div class="structItem structItem--thread"><div class="structItem-cell structItem-cell--main"><div class="structItem-title"><a class="labelLink" href="/tags/x">Tag</a><a href="/threads/t.{id}/">Thread {id}</a></div>'
+                       '<div class="structItem-minor"><ul class="structItem-parts"><li><a class="username" href="/members/u.{user}/">user{user}</a></li><li><time datetime="{created}">d</time></li></ul></div></div>'
+                       '<div class="structItem-cell structItem-cell--meta"><dl><dt>Replies</dt><dd>{answers}</dd></dl><dl><dt>Views</dt><dd>{views}</dd></dl></div>'
+                       '<div class="structItem-cell structItem-cell--latest"><time datetime="{last}">l</time></div></div>'.format(
+                           id=t['id'], user=first['user'], created=self.format_date(first['when']), answers=len(t['posts'])-1, views=len(t['posts'])*3, last=self.format_date(t['posts'][-1]['when'])))
+        out.append('</div></div>')
+        out.append(self.page_nav(base, page, total))
+        out.append('</body></html>')
+        return "".join(out)
+
+    def thread(self, thread_id, page):
+        t = self.threads.get(thread_id)
+        if t==None:
+            return None
+
+        total = max(1, (len(t['posts'])+self.posts_per_page-1)//self.posts_per_page)
+        page = min(page, total) # XenForo shows the last page when asked for one past the end
+        base = "/threads/t.{}/".format(thread_id)
+        out = ['<html><body>', self.page_nav(base, page, total)]
+        for p in t['posts'][(page-1)*self.posts_per_page:page*self.posts_per_page]:
+            out.append('<article class="message message--post" data-content="post-{id}"><div class="message-inner"><div class="message-cell message-cell--user"><a class="username" href="/members/u.{user}/">user{user}</a></div>'
+                       '<div class="message-cell message-cell--main"><header class="message-attribution"><time datetime="{created}">d</time></header>'
+                       '<article class="message-body"><div class="bbWrapper">{body}</div></article></div></div></article>'.format(id=p['id'], user=p['user'], created=self.format_date(p['when']), body=p['body']))
+        out.append(self.page_nav(base, page, total))
+        out.append('</body></html>')
+        return "".join(out)
+
+    def render(self, path): # html of path, or None when it does not exist
+        if path=="/" or path=="":
+            return self.home()
+        m = re.match(r'^/(forums|threads)/[a-z]+\.(\d+)/(?:page-(\d+))?$', path)
+        if m==None:
+            return None
+        page = int(m.group(3) or 1)
+        if m.group(1)=="forums":
+            return self.listing(int(m.group(2)), page)
+        return self.thread(int(m.group(2)), page)
+
+
+def serve(forum, port=0, latency=0.0, error_rate=0.0, host="127.0.0.1"): # HTTP server in background threads. port 0 picks a free one
+    # latency: seconds added to every answer. error_rate: fraction of requests answered with 503 and Retry-After.
+    # Pages have an ETag, so revalidated requests (-cr) are answered with 304 when unchanged.
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1" # keep-alive
+
+        def log_message(self, *args):
+            pass
+
+        def send_empty(self, status, headers={}):
+            self.send_response(status)
+            for k in headers:
+                self.send_header(k, headers[k])
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def do_GET(self):
+            if latency>0:
+                time.sleep(latency)
+            if error_rate>0 and random.random()<error_rate:
+                server.count("503")
+                self.send_empty(503, {'Retry-After': "1"})
+                return
+
+            body = forum.render(self.path)
+            if body==None:
+                server.count("404")
+                self.send_empty(404)
+                return
+
+            body = body.encode("utf-8")
+            etag = '"{}"'.format(hashlib.md5(body).hexdigest())
+            if self.headers.get("If-None-Match")==etag:
+                server.count("304")
+                self.send_empty(304, {'ETag': etag})
+                return
+
+            server.count("200")
+            self.send_response(200)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    server.stats = {} # answers by status
+    server.lock_stats = threading.Lock()
+
+    def count(status):
+        with server.lock_stats:
+            server.stats[status] = server.stats.get(status, 0)+1
+    server.count = count
+
+    threading.Thread(target=server.serve_forever, name="fake_xenforo", daemon=True).start()
+    return server
+
+def url_of(server):
+    return "http://{}:{}/".format(*server.server_address[0:2])
+
+
+if __name__ == "__main__":
+
+    ap = argparse.ArgumentParser()
+
+    ap.add_argument("-p", "--port", required=False, default=8000, type=int, help="Port to listen on")
+    ap.add_argument("-c", "--categories", required=False, default=1, type=int, help="Amount of categories")
+    ap.add_argument("-s", "--subs", required=False, default=2, type=int, help="Subcategories of each category")
+    ap.add_argument("-t", "--threads", required=False, default=30, type=int, help="Threads of each subcategory")
+    ap.add_argument("-m", "--posts", required=False, default=45, type=int, help="Maximum posts of a thread")
+    ap.add_argument("-w", "--post-words", required=False, default=20, type=int, help="Words in each post")
+    ap.add_argument("-l", "--latency", required=False, default=0.0, type=float, help="Seconds added to every answer")
+    ap.add_argument("-er", "--error-rate", required=False, default=0.0, type=float, help="Fraction of requests answered with 503")
+
+    args = vars(ap.parse_args())
+
+    forum = Forum(args['categories'], args['subs'], args['threads'], args['posts'], post_words=args['post_words'])
+    server = serve(forum, args['port'], args['latency'], args['error_rate'])
+    print("Serving {} threads on {}".format(len(forum.threads), url_of(server)))
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        print(server.stats)
@@ -0,0 +1,147 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+
+class Frontier: # tasks of the current run (subcategory listings, threads) persisted in frontier.sqlite
+    # A task is leased while a worker runs it and acknowledged when it ends. When a run is killed, the
+    # next one resumes it: acknowledged tasks and completed phases are not run again, leased tasks go
+    # back to pending and keep the state they saved while running (next page to request). Phases
+    # completed by older runs are started again with new tasks.
+
+    def __init__(self, file):
+        self.file = file
+        self.run = None # run of the phases started by this process, see open_run
+        self.interrupted = None # run resumed by this process
+
+        # locks
+        self.lock = threading.Lock()
+
+        self.db = sqlite3.connect(self.file, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("""CREATE TABLE IF NOT EXISTS phases (
+            phase TEXT PRIMARY KEY,
+            status TEXT,
+            started REAL,
+            finished REAL,
+            run INTEGER
+        )""")
+        self.db.execute("""CREATE TABLE IF NOT EXISTS tasks (
+            phase TEXT,
+            key TEXT,
+            payload TEXT,
+            state TEXT,
+            status TEXT,
+            updated REAL,
+            PRIMARY KEY (phase, key)
+        )""")
+        self.db.execute("CREATE INDEX IF NOT EXISTS tasks_status ON tasks (phase, status)")
+
+    def has_unfinished_run(self): # a previous run was stopped before the end of a phase
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*) FROM phases WHERE status='running'").fetchone()[0]>0
+
+    def open_run(self, resume): # every process is a new run. When resuming, the phases of the interrupted one are continued
+        with self.lock:
+            self.run = self.db.execute("SELECT COALESCE(MAX(run), 0)+1 FROM phases").fetchone()[0]
+            self.interrupted = None
+            if resume:
+                self.interrupted = self.db.execute("SELECT MAX(run) FROM phases WHERE status='running'").fetchone()[0]
+
+    def discard(self): # forget the previous run
+        with self.lock:
+            self.db.execute("DELETE FROM tasks")
+            self.db.execute("DELETE FROM phases")
+
+    def count(self, phase, status):
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*) FROM tasks WHERE phase=? AND status=?", (phase, status)).fetchone()[0]
+
+    def progress(self, phase): # (tasks done or failed, tasks total)
+        with self.lock:
+            row = self.db.execute("SELECT COALESCE(SUM(status IN ('done', 'failed')), 0), COUNT(*) FROM tasks WHERE phase=?", (phase,)).fetchone()
+        return row[0], row[1]
+
+    def start(self, phase, tasks, resume): # tasks: (key, payload). False when the phase was already completed
+        with self.lock:
+            row = self.db.execute("SELECT status, run FROM phases WHERE phase=?", (phase,)).fetchone()
+        status = None
+        if resume and row!=None and (row[1]==self.interrupted or row[1]==self.run): # a phase of another run is started again
+            status = row[0]
+
+        if resume and status=="done":
+            logging.info("Frontier {}: completed by the interrupted run".format(phase))
+            return False
+
+        if resume and status=="running":
+            with self.lock:
+                self.db.execute("UPDATE tasks SET status='pending' WHERE phase=? AND status='leased'", (phase,))
+                self.db.execute("UPDATE phases SET run=? WHERE run=?", (self.run, self.interrupted)) # this run continues the interrupted one
+            logging.info("Frontier {}: resuming. pending: {} done: {}".format(phase, self.count(phase, "pending"), self.count(phase, "done")))
+            return True
+
+        now = time.time()
+        with self.lock:
+            self.db.execute("BEGIN")
+            try:
+                self.db.execute("DELETE FROM tasks WHERE phase=?", (phase,))
+                self.db.executemany("INSERT OR IGNORE INTO tasks VALUES (?, ?, ?, NULL, 'pending', ?)", ((phase, key, json.dumps(payload), now) for key, payload in tasks))
+                self.db.execute("INSERT OR REPLACE INTO phases (phase, status, started, finished, run) VALUES (?, 'running', ?, NULL, ?)", (phase, now, self.run))
+                self.db.execute("COMMIT")
+            except:
+                self.db.execute("ROLLBACK")
+                raise
+        logging.info("Frontier {}: {} tasks".format(phase, self.count(phase, "pending")))
+        return True
+
+    def lease(self, phase): # next pending task, or None
+        with self.lock:
+            row = self.db.execute("SELECT key, payload, state FROM tasks WHERE phase=? AND status='pending' ORDER BY rowid LIMIT 1", (phase,)).fetchone()
+            if row==None:
+                return None
+            self.db.execute("UPDATE tasks SET status='leased', updated=? WHERE phase=? AND key=?", (time.time(), phase, row[0]))
+
+        state = None
+        if row[2]!=None:
+            state = json.loads(row[2])
+        return {'phase': phase, 'key': row[0], 'payload': json.loads(row[1]), 'state': state}
+
+    def leases(self, phase): # generator of tasks, leased one by one while the workers consume them
+        while True:
+            task = self.lease(phase)
+            if task==None:
+                return
+            yield task
+
+    def save_state(self, task, state): # resume point of a leased task
+        task['state'] = state
+        with self.lock:
+            self.db.execute("UPDATE tasks SET state=?, updated=? WHERE phase=? AND key=?", (json.dumps(state), time.time(), task['phase'], task['key']))
+
+    def set_status(self, task, status):
+        with self.lock:
+            self.db.execute("UPDATE tasks SET status=?, updated=? WHERE phase=? AND key=?", (status, time.time(), task['phase'], task['key']))
+
+    def ack(self, task):
+        self.set_status(task, "done")
+
+    def fail(self, task): # not retried in this run
+        self.set_status(task, "failed")
+
+    def finish(self, phase): # mark the phase completed when no task is left
+        left = self.count(phase, "pending")+self.count(phase, "leased")
+        if left>0:
+            logging.warning("Frontier {}: {} tasks left for the next run".format(phase, left))
+            return False
+
+        with self.lock:
+            self.db.execute("UPDATE phases SET status='done', finished=? WHERE phase=?", (time.time(), phase))
+        logging.info("Frontier {}: completed. done: {} failed: {}".format(phase, self.count(phase, "done"), self.count(phase, "failed")))
+        return True
+
+    def close(self):
+        with self.lock:
+            self.db.close()
@@ -0,0 +1,47 @@
+import json
+import logging
+import os
+import threading
+
+
+class IdAllocator: # ids for categories, subcategories and threads
+    # 'last_id' in config.json is a high-water mark: every id below it may be in use. Ids are reserved
+    # in blocks, so the file is written once per block instead of once per id. After a crash the
+    # unused part of the last block is skipped, never reused.
+
+    def __init__(self, config_file, block_size=1000):
+        self.config_file = config_file
+        self.block_size = block_size
+
+        with open(self.config_file, "r") as f:
+            data = json.loads(f.read())
+
+        self.next_id = data['last_id']
+        self.reserved_until = self.next_id # nothing reserved yet
+
+        # locks
+        self.lock_new_id = threading.Lock()
+
+    def reserve(self): # caller holds lock_new_id
+        with open(self.config_file, "r") as f:
+            data = json.loads(f.read())
+
+        self.reserved_until = max(self.next_id, data['last_id'])+self.block_size
+        data['last_id'] = self.reserved_until
+
+        tmp = self.config_file+".tmp"
+        with open(tmp, "w") as f:
+            f.write(json.dumps(data, indent=2))
+            f.flush()
+            os.fsync(f.fileno()) # the mark must be on disk before any id of the block is used
+        os.replace(tmp, self.config_file)
+
+        logging.info("Reserved ids {} to {}".format(self.next_id, self.reserved_until-1))
+
+    def get(self):
+        with self.lock_new_id:
+            if self.next_id>=self.reserved_until:
+                self.reserve()
+            v = self.next_id
+            self.next_id += 1
+        return v
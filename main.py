@@ -4,10 +4,11 @@ import logging
 import time
 
 from MinerXenForo import Manager
+from serializer import FORMATS
 
 
 
-def main(base_url, reload_threads, max_request, cache_pages, summary, reload_posts):
+def main(base_url, reload_threads, max_request, cache_pages, summary, reload_posts, pool_connections, pool_maxsize, connect_timeout, read_timeout, engine, rate_limit, rate_burst, max_retries, autotune, autotune_min, cache_revalidate, cache_size, parser, parse_workers, force, fan_out, fresh, serializer, metrics_interval):
     args = locals()
 
     FORMAT = '%(asctime)s %(levelname)s %(funcName)s %(threadName)s - \t %(message)s'
@@ -16,18 +17,29 @@ def main(base_url, reload_threads, max_request, cache_pages, summary, reload_pos
     logging.info('Starting')
     logging.info(str(args))
 
-    mng = Manager(base_url, max_request, cache_pages)
+    autotune_floor = None
+    if autotune:
+        autotune_floor = autotune_min
 
-    if summary:
-        mng.print_summary()
-        print("\n*When the summary is shown nothing else is done.")
-        return
-    else:
-        if reload_threads:
-            mng.reload_threads()
+    cache_max_size = None
+    if cache_size!=None:
+        cache_max_size = int(cache_size*1024*1024)
 
-        if reload_posts:
-            mng.reload_posts()
+    mng = Manager(base_url, max_request, cache_pages, pool_connections, pool_maxsize, (connect_timeout, read_timeout), engine, rate_limit, rate_burst, max_retries, autotune_floor, cache_revalidate, cache_max_size, parser, parse_workers, force, fan_out, fresh, serializer, metrics_interval)
+
+    try:
+        if summary:
+            mng.print_summary()
+            print("\n*When the summary is shown nothing else is done.")
+            return
+        else:
+            if reload_threads:
+                mng.reload_threads()
+
+            if reload_posts:
+                mng.reload_posts()
+    finally:
+        mng.close()
 
 
 if __name__ == "__main__":
@@ -39,14 +51,37 @@ if __name__ == "__main__":
     ap.add_argument("-s", "--summary", required=False, action="store_true", help="Summary")
     ap.add_argument("-rt", "--reload-threads", required=False, action="store_true", help="If present the miner will search for new threads")
     ap.add_argument("-rp", "--reload-posts", required=False, action="store_true", help="If present the miner will search for new posts in previously detected threads")
+    ap.add_argument("-f", "--force", required=False, action="store_true", help="With -rp, reload posts of every thread instead of only the ones whose listing changed")
+    ap.add_argument("-fr", "--fresh", required=False, action="store_true", help="Start over instead of resuming the run that was interrupted")
+    ap.add_argument("-sf", "--serializer", required=False, default="json", choices=FORMATS, help="Format of category and thread files. json-compact and orjson are smaller and faster, msgpack (zstd compressed) the smallest")
+    ap.add_argument("-mi", "--metrics-interval", required=False, default=10, type=float, help="Seconds between metrics reports (metrics.prom, metrics.json and the progress line). 0 disables them")
     ap.add_argument("-cp", "--cache-pages", required=False, action="store_true", help="Cache HTML requests. High storage memmory usage")
+    ap.add_argument("-cr", "--cache-revalidate", required=False, action="store_true", help="With -cp, revalidate cached pages using ETag/Last-Modified instead of always using them")
+    ap.add_argument("-cs", "--cache-size", required=False, default=None, type=float, help="Maximum size of the -cp cache in MB. Least recently used pages are removed above it")
     ap.add_argument("-mr", "--max-request", required=False, default=1, type=int, help="Maximum simultaneous request")
+    ap.add_argument("-e", "--engine", required=False, default="thread", choices=["thread", "async"], help="thread: a fixed pool of -mr long-lived threads taking the pages from a bounded queue. async: coroutines over aiohttp, allows -mr up to 1000")
+    ap.add_argument("-fo", "--fan-out", required=False, default=1, type=int, help="Pages of the same thread or listing requested simultaneously, within --max-request. 1 requests one page at a time")
+    ap.add_argument("-at", "--autotune", required=False, action="store_true", help="Adjust the simultaneous requests between --autotune-min and --max-request using latency, errors and throttling")
+    ap.add_argument("-atm", "--autotune-min", required=False, default=1, type=int, help="Lowest simultaneous requests used by --autotune")
+    ap.add_argument("-rl", "--rate-limit", required=False, default=None, type=float, help="Maximum requests per second to each host. Default is unlimited")
+    ap.add_argument("-rb", "--rate-burst", required=False, default=1, type=int, help="Requests allowed above --rate-limit in a burst")
+    ap.add_argument("-re", "--max-retries", required=False, default=3, type=int, help="Attempts per page before giving up")
+    ap.add_argument("-hp", "--parser", required=False, default="html.parser", choices=["html.parser", "lxml", "lexbor"], help="HTML parser. lxml and lexbor (selectolax) are faster than html.parser")
+    ap.add_argument("-pw", "--parse-workers", required=False, default=0, type=int, help="Processes parsing the downloaded pages. 0 parses in the downloading thread. Use the number of cores to scale past one core")
+    ap.add_argument("-pc", "--pool-connections", required=False, default=10, type=int, help="Amount of hosts kept in the connection pool")
+    ap.add_argument("-pm", "--pool-maxsize", required=False, default=None, type=int, help="Keep-alive connections per host. Default is the value of --max-request")
+    ap.add_argument("-ct", "--connect-timeout", required=False, default=10, type=float, help="Seconds to wait while connecting")
+    ap.add_argument("-rto", "--read-timeout", required=False, default=60, type=float, help="Seconds to wait for the server response")
 
     args = vars(ap.parse_args())
 
     start = time.time()
 
-    main(args['url'], args['reload_threads'], args['max_request'], args['cache_pages'], args['summary'], args['reload_posts'])
+    try:
+        main(args['url'], args['reload_threads'], args['max_request'], args['cache_pages'], args['summary'], args['reload_posts'], args['pool_connections'], args['pool_maxsize'], args['connect_timeout'], args['read_timeout'], args['engine'], args['rate_limit'], args['rate_burst'], args['max_retries'], args['autotune'], args['autotune_min'], args['cache_revalidate'], args['cache_size'], args['parser'], args['parse_workers'], args['force'], args['fan_out'], args['fresh'], args['serializer'], args['metrics_interval'])
+    except KeyboardInterrupt:
+        print("Interrupted")
+        logging.warning("Interrupted by the user")
 
     end = time.time()
     total = end-start
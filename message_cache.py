@@ -0,0 +1,93 @@
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+
+
+class MessageCache: # cleaned text of every message by the sha1 of its html, and the last result of every thread
+    # Cleaning a thread again only cleans the messages not seen before. A thread whose messages, authors and
+    # options did not change since its files were written is not written again. Entries of another version
+    # (tags, tokenization) are dropped when the cache is opened.
+
+    def __init__(self, file, version):
+        self.file = file
+
+        # locks
+        self.lock = threading.Lock()
+
+        self.db = sqlite3.connect(self.file, check_same_thread=False, isolation_level=None, timeout=60) # shared by worker processes
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("""CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        )""")
+        self.db.execute("""CREATE TABLE IF NOT EXISTS messages (
+            key TEXT PRIMARY KEY,
+            text TEXT,
+            tokens INTEGER,
+            targets TEXT
+        )""")
+        self.db.execute("""CREATE TABLE IF NOT EXISTS threads (
+            id INTEGER PRIMARY KEY,
+            signature TEXT,
+            tokens_lens TEXT,
+            conversations_lens TEXT
+        )""")
+
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.db.execute("SELECT value FROM meta WHERE key='version'").fetchone()
+                if row==None or row[0]!=version:
+                    if row!=None:
+                        logging.info("Message cache {}: version changed, cleaning every message again".format(self.file))
+                    self.db.execute("DELETE FROM messages")
+                    self.db.execute("DELETE FROM threads")
+                    self.db.execute("INSERT OR REPLACE INTO meta VALUES ('version', ?)", (version,))
+                self.db.execute("COMMIT")
+            except:
+                self.db.execute("ROLLBACK")
+                raise
+
+    def key(self, html):
+        return hashlib.sha1(html.encode("utf-8")).hexdigest()
+
+    def get_many(self, keys): # key -> (text, tokens, targets) of the cached keys
+        res = {}
+        keys = list(set(keys))
+        with self.lock:
+            for i in range(0, len(keys), 500): # sqlite limits the parameters of a query
+                chunk = keys[i:i+500]
+                rows = self.db.execute("SELECT key, text, tokens, targets FROM messages WHERE key IN ({})".format(",".join("?"*len(chunk))), chunk)
+                for key, text, tokens, targets in rows:
+                    res[key] = (text, tokens, json.loads(targets))
+        return res
+
+    def put_many(self, rows): # (key, text, tokens, targets)
+        if len(rows)==0:
+            return
+        with self.lock:
+            self.db.execute("BEGIN")
+            try:
+                self.db.executemany("INSERT OR REPLACE INTO messages VALUES (?, ?, ?, ?)", ((key, text, tokens, json.dumps(targets)) for key, text, tokens, targets in rows))
+                self.db.execute("COMMIT")
+            except:
+                self.db.execute("ROLLBACK")
+                raise
+
+    def thread(self, thread_id): # (signature, tokens_lens, conversations_lens) of the last files written, or None
+        with self.lock:
+            row = self.db.execute("SELECT signature, tokens_lens, conversations_lens FROM threads WHERE id=?", (int(thread_id),)).fetchone()
+        if row==None:
+            return None
+        return row[0], json.loads(row[1]), json.loads(row[2])
+
+    def set_thread(self, thread_id, signature, tokens_lens, conversations_lens):
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO threads VALUES (?, ?, ?, ?)", (int(thread_id), signature, json.dumps(tokens_lens), json.dumps(conversations_lens)))
+
+    def count(self):
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
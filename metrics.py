@@ -0,0 +1,224 @@
+import bisect
+import json
+import logging
+import sys
+import threading
+import time
+from serializer import write_atomic
+
+PREFIX = "xenforo_miner_"
+LATENCY_BUCKETS = [0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60] # seconds
+
+DESCRIPTIONS = { # name -> (prometheus type, help)
+    'requests_total': ("counter", "HTTP requests by status code"),
+    'request_seconds': ("histogram", "Latency of HTTP requests"),
+    'bytes_received_total': ("counter", "Bytes of the downloaded pages as received, before decompression"),
+    'cache_total': ("counter", "Page cache lookups by result"),
+    'retries_total': ("counter", "Retried requests by cause"),
+    'failures_total': ("counter", "Pages given up after every retry"),
+    'parse_seconds': ("histogram", "Time to parse a page by kind"),
+    'pages_total': ("counter", "Pages parsed by kind"),
+    'posts_stored_total': ("counter", "Posts appended to thread files"),
+    'threads_completed_total': ("counter", "Threads mined to the end"),
+    'queue_depth': ("gauge", "Tasks waiting for a worker"),
+    'in_flight': ("gauge", "Requests in flight"),
+}
+
+
+class Histogram:
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0]*(len(buckets)+1) # last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q): # upper bound of the bucket holding the quantile
+        if self.count==0:
+            return None
+        target = q*self.count
+        cumulative = 0
+        for i in range(len(self.counts)):
+            cumulative += self.counts[i]
+            if cumulative>=target:
+                if i<len(self.buckets):
+                    return self.buckets[i]
+                return float("inf")
+
+
+class Metrics: # counters, gauges and histograms shared by every worker
+    # Series are identified by name and labels, e.g. requests_total{status="200"}.
+
+    def __init__(self):
+        self.started = time.time()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+
+        # locks
+        self.lock = threading.Lock()
+
+    def key(self, name, labels):
+        return (name, tuple(sorted(labels.items())))
+
+    def inc(self, name, value=1, **labels):
+        key = self.key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0)+value
+
+    def set(self, name, value, **labels):
+        with self.lock:
+            self.gauges[self.key(name, labels)] = value
+
+    def add(self, name, value, **labels): # change a gauge
+        key = self.key(name, labels)
+        with self.lock:
+            self.gauges[key] = self.gauges.get(key, 0)+value
+
+    def observe(self, name, value, **labels):
+        key = self.key(name, labels)
+        with self.lock:
+            if not key in self.histograms:
+                self.histograms[key] = Histogram(LATENCY_BUCKETS)
+            self.histograms[key].observe(value)
+
+    def total(self, name, **labels): # sum of the counters of name matching labels
+        with self.lock:
+            return sum(v for k, v in self.counters.items() if k[0]==name and all(l in k[1] for l in labels.items()))
+
+    def gauge(self, name): # sum of the gauges of name
+        with self.lock:
+            return sum(v for k, v in self.gauges.items() if k[0]==name)
+
+    def series_name(self, key, suffix="", extra=None):
+        labels = list(key[1])
+        if extra!=None:
+            labels.append(extra)
+        name = PREFIX+key[0]+suffix
+        if len(labels)==0:
+            return name
+        return name+"{"+",".join('{}="{}"'.format(k, str(v).replace('"', "'")) for k, v in labels)+"}"
+
+    def snapshot(self):
+        with self.lock:
+            uptime = time.time()-self.started
+            histograms = {}
+            for k, h in self.histograms.items():
+                histograms[self.series_name(k)] = {'count': h.count, 'sum': h.sum, 'p50': h.quantile(0.5), 'p95': h.quantile(0.95), 'p99': h.quantile(0.99)}
+            return {
+                'time': time.time(),
+                'uptime': uptime,
+                'counters': {self.series_name(k): v for k, v in self.counters.items()},
+                'gauges': {self.series_name(k): v for k, v in self.gauges.items()},
+                'histograms': histograms,
+            }
+
+    def prometheus(self): # text exposition format, for the node_exporter textfile collector
+        lines = []
+        with self.lock:
+            names = sorted(set([k[0] for k in list(self.counters)+list(self.gauges)+list(self.histograms)]))
+            for name in names:
+                kind, description = DESCRIPTIONS.get(name, ("untyped", name))
+                lines.append("# HELP {}{} {}".format(PREFIX, name, description))
+                lines.append("# TYPE {}{} {}".format(PREFIX, name, kind))
+                for series in [self.counters, self.gauges]:
+                    for k in sorted(series):
+                        if k[0]==name:
+                            lines.append("{} {}".format(self.series_name(k), series[k]))
+                for k in sorted(self.histograms):
+                    if k[0]!=name:
+                        continue
+                    h = self.histograms[k]
+                    cumulative = 0
+                    for i in range(len(h.counts)):
+                        cumulative += h.counts[i]
+                        le = "+Inf" if i==len(h.buckets) else str(h.buckets[i])
+                        lines.append("{} {}".format(self.series_name(k, "_bucket", ("le", le)), cumulative))
+                    lines.append("{} {}".format(self.series_name(k, "_sum"), h.sum))
+                    lines.append("{} {}".format(self.series_name(k, "_count"), h.count))
+        return "\n".join(lines)+"\n"
+
+
+class Reporter: # writes metrics.prom and metrics.json and shows a progress line every interval seconds
+
+    def __init__(self, metrics, folder, interval, progress=None):
+        self.metrics = metrics
+        self.folder = folder
+        self.interval = interval
+        self.progress = progress # function -> (phase, tasks done, tasks total), or None
+
+        self.last = (metrics.started, 0, 0, 0) # (time, pages, posts, threads) of the previous report
+        self.phase = None
+        self.phase_start = None # (time, tasks done) when the phase was first seen
+
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="metrics", daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.report()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+        self.report()
+        if sys.stdout.isatty():
+            print()
+
+    def report(self):
+        try:
+            write_atomic(self.folder+"metrics.prom", self.metrics.prometheus())
+            write_atomic(self.folder+"metrics.json", json.dumps(self.metrics.snapshot(), indent=2))
+            line = self.progress_line()
+        except Exception as e:
+            logging.error("ERROR writing metrics: {}".format(e))
+            return
+
+        logging.info(line)
+        if sys.stdout.isatty(): # otherwise only logged
+            print("\r"+line+"\033[K", end="", flush=True)
+
+    def progress_line(self):
+        m = self.metrics
+        now = time.time()
+        pages = m.total('pages_total')
+        posts = m.total('posts_stored_total')
+        threads = m.total('threads_completed_total')
+
+        elapsed = max(now-self.last[0], 1e-9)
+        rates = ((pages-self.last[1])/elapsed, (posts-self.last[2])/elapsed, (threads-self.last[3])/elapsed)
+        self.last = (now, pages, posts, threads)
+
+        hits = m.total('cache_total', result="hit")+m.total('cache_total', result="revalidated")
+        lookups = hits+m.total('cache_total', result="miss")
+
+        parts = []
+        if self.progress!=None:
+            phase, done, total = self.progress()
+            if phase!=None:
+                if phase!=self.phase:
+                    self.phase = phase
+                    self.phase_start = (now, done)
+                eta = "-"
+                speed = (done-self.phase_start[1])/max(now-self.phase_start[0], 1e-9)
+                if speed>0:
+                    eta = time.strftime("%H:%M:%S", time.gmtime((total-done)/speed))
+                parts.append("[{}] {}/{} tasks {:.1f}% ETA {}".format(phase, done, total, 100.0*done/max(total, 1), eta))
+
+        parts.append("{:.1f} pages/s".format(rates[0]))
+        parts.append("{:.1f} posts/s".format(rates[1]))
+        parts.append("{:.2f} threads/s".format(rates[2]))
+        parts.append("cache {:.0f}%".format(100.0*hits/max(lookups, 1)))
+        parts.append("retries {}".format(m.total('retries_total')))
+        parts.append("failures {}".format(m.total('failures_total')))
+        parts.append("queue {}".format(m.gauge('queue_depth')))
+        parts.append("in flight {}".format(m.gauge('in_flight')))
+        return " | ".join(parts)
@@ -0,0 +1,172 @@
+import gzip
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+try:
+    import zstandard
+except ImportError: # gzip is used when zstandard is not installed
+    zstandard = None
+
+
+class PageCache: # html of every requested url plus its validators (ETag, Last-Modified)
+    # Files are named by the sha1 of the url and sharded in two levels (ab/cd/abcd....html.zst).
+    # index.sqlite keeps location, size, validators and last access of every page, so lookups never touch
+    # the cached files and the least recently used pages can be evicted when max_size is reached.
+
+    def __init__(self, folder, max_size=None):
+        self.folder = folder
+        self.max_size = max_size # bytes on disk. None means unlimited
+
+        self.codec = "gzip"
+        if zstandard!=None:
+            self.codec = "zstd"
+
+        if not os.path.exists(self.folder): # create cache folder
+            os.makedirs(self.folder)
+
+        # locks
+        self.lock = threading.Lock()
+
+        self.db = sqlite3.connect(self.folder+"index.sqlite", check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("""CREATE TABLE IF NOT EXISTS pages (
+            key TEXT PRIMARY KEY,
+            url TEXT,
+            file TEXT,
+            codec TEXT,
+            size INTEGER,
+            etag TEXT,
+            last_modified TEXT,
+            stored REAL,
+            accessed REAL
+        )""")
+        self.db.execute("CREATE INDEX IF NOT EXISTS pages_accessed ON pages (accessed)")
+
+        self.total_size = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM pages").fetchone()[0]
+        logging.info("Page cache {} pages: {} size: {} bytes codec: {} max_size: {}".format(self.folder, self.count(), self.total_size, self.codec, self.max_size))
+
+    def count(self):
+        return self.db.execute("SELECT COUNT(*) FROM pages").fetchone()[0]
+
+    def key(self, url):
+        return hashlib.sha1(url.encode("utf-8")).hexdigest()
+
+    def file_name(self, key, codec):
+        extension = {"zstd": ".html.zst", "gzip": ".html.gz"}[codec]
+        return "{}/{}/{}{}".format(key[0:2], key[2:4], key, extension)
+
+    def compress(self, content, codec):
+        data = content.encode("utf-8")
+        if codec=="zstd":
+            return zstandard.ZstdCompressor(level=3).compress(data)
+        return gzip.compress(data, compresslevel=6)
+
+    def decompress(self, data, codec):
+        if codec=="zstd":
+            return zstandard.ZstdDecompressor().decompress(data).decode("utf-8")
+        return gzip.decompress(data).decode("utf-8")
+
+    def get(self, url): # (content, validators). content is None on cache miss
+        key = self.key(url)
+        with self.lock:
+            row = self.db.execute("SELECT file, codec, etag, last_modified FROM pages WHERE key=?", (key,)).fetchone()
+            if row==None:
+                return None, {}
+            self.db.execute("UPDATE pages SET accessed=? WHERE key=?", (time.time(), key))
+
+        file, codec, etag, last_modified = row
+        try:
+            with open(self.folder+file, "rb") as f:
+                content = self.decompress(f.read(), codec)
+        except (OSError, EOFError, ValueError) as e: # missing or corrupted file. Behave as a miss
+            logging.warning("Cache file unreadable {}: {}".format(file, e))
+            self.remove(key)
+            return None, {}
+
+        validators = {}
+        if etag!=None:
+            validators['etag'] = etag
+        if last_modified!=None:
+            validators['last_modified'] = last_modified
+
+        return content, validators
+
+    def put(self, url, content, headers):
+        key = self.key(url)
+        file = self.file_name(key, self.codec)
+        data = self.compress(content, self.codec)
+
+        folder = os.path.dirname(self.folder+file)
+        if not os.path.exists(folder):
+            os.makedirs(folder, exist_ok=True)
+
+        tmp = "{}.{}.tmp".format(self.folder+file, threading.get_ident())
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, self.folder+file)
+
+        validators = validators_from_headers(headers)
+        now = time.time()
+        with self.lock:
+            old = self.db.execute("SELECT size FROM pages WHERE key=?", (key,)).fetchone()
+            if old!=None:
+                self.total_size -= old[0]
+            self.db.execute("INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, url, file, self.codec, len(data), validators.get('etag'), validators.get('last_modified'), now, now))
+            self.total_size += len(data)
+
+        self.evict()
+
+    def remove(self, key):
+        with self.lock:
+            row = self.db.execute("SELECT file, size FROM pages WHERE key=?", (key,)).fetchone()
+            if row==None:
+                return
+            self.db.execute("DELETE FROM pages WHERE key=?", (key,))
+            self.total_size -= row[1]
+
+        try:
+            os.remove(self.folder+row[0])
+        except OSError:
+            pass
+
+    def evict(self): # remove least recently used pages until 90% of max_size
+        if self.max_size==None or self.total_size<=self.max_size:
+            return
+
+        target = self.max_size*0.9
+        removed = 0
+        while self.total_size>target:
+            with self.lock:
+                rows = self.db.execute("SELECT key FROM pages ORDER BY accessed LIMIT 100").fetchall()
+            if len(rows)==0:
+                break
+            for row in rows:
+                self.remove(row[0])
+                removed += 1
+                if self.total_size<=target:
+                    break
+
+        logging.info("Cache evicted {} pages. Size: {} bytes".format(removed, self.total_size))
+
+
+def validators_from_headers(headers):
+    validators = {}
+    if headers.get('ETag')!=None:
+        validators['etag'] = headers.get('ETag')
+    if headers.get('Last-Modified')!=None:
+        validators['last_modified'] = headers.get('Last-Modified')
+    return validators
+
+def conditional_headers(validators): # headers to revalidate a cached page
+    headers = {}
+    if 'etag' in validators:
+        headers['If-None-Match'] = validators['etag']
+    if 'last_modified' in validators:
+        headers['If-Modified-Since'] = validators['last_modified']
+    return headers
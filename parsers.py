@@ -0,0 +1,237 @@
+import urllib.parse
+from datetime import datetime
+import pytz
+from bs4 import BeautifulSoup, SoupStrainer
+
+BACKENDS = ["html.parser", "lxml", "lexbor"] # lexbor requires selectolax
+
+
+def parse_datetime(value): # XenForo dates look like 2021-05-01T10:00:00-0300
+    return datetime.fromisoformat(value[0:-2]+":"+value[-2:])
+
+def min_datetime():
+    return datetime.min.replace(tzinfo=pytz.timezone('America/Sao_Paulo'))
+
+def extract_page_nav(html, base_url):
+    try:
+        total_pages = int(html.find("ul", class_="pageNav-main").find_all('li')[-1].text)
+    except:
+        total_pages = 1
+
+    next_url = None
+    next_el = html.find("a", class_="pageNav-jump--next")
+    if next_el!=None:
+        next_url = urllib.parse.urljoin(base_url, next_el['href'])
+
+    return total_pages, next_url
+
+def extract_posts(html, base_url): # page of a thread -> list of posts
+    total_pages, next_url = extract_page_nav(html, base_url)
+
+    posts = []
+    for message in html.find_all('article', class_="message--post"):
+
+        official_id = message['data-content']
+        user = message.find('div', class_="message-cell--user").find('a', class_="username")
+
+        try:
+            user_name = user.text
+            user_href = user['href']
+        except:
+            user_name = ''
+            user_href = ''
+
+        main = message.find('div', class_="message-cell--main")
+        creation_time = main.find('header').find('time')['datetime']
+
+        posts.append({
+            'official_id': official_id,
+            'user_name': user_name,
+            'user_href': user_href,
+            'creation': creation_time,
+            'message': str(main.find('article', class_='message-body').find('div', class_='bbWrapper')),
+        })
+
+    return {'posts': posts, 'total_pages': total_pages, 'next': next_url}
+
+def extract_threads(html, base_url): # page of a subcategory -> list of threads
+    total_pages, next_url = extract_page_nav(html, base_url)
+
+    threads = []
+    for post in html.find_all("div", class_="structItem-title"):
+
+        is_fixed = "structItemContainer-group--sticky" in post.parent.parent.parent['class']
+        user_el = post.parent.find('div', class_='structItem-minor').li.a
+        member_href = ""
+        member_name = ""
+        try:
+            member_href = user_el['href']
+            member_href = urllib.parse.urljoin(base_url, member_href)
+            member_name = user_el.text
+        except:
+            pass
+        date_thread = post.parent.parent.find('time')['datetime']
+
+        tags_a = post.find_all('a')
+
+        title = tags_a[-1].text
+        href = urllib.parse.urljoin(base_url, tags_a[-1]['href'])
+
+        tags_thread = list(map(lambda x: x.text ,tags_a[0:-1]))
+
+        meta = post.parent.parent.find('div', class_="structItem-cell--meta").find_all("dl")
+        answers = meta[0].find_all("dd")[0].text
+        visits = meta[1].find_all("dd")[0].text
+
+        try:
+            last_post = post.parent.parent.find("div", class_="structItem-cell--latest").find('time')['datetime']
+        except:
+            last_post = min_datetime().isoformat()
+            last_post = last_post[0:-3]+last_post[-2:]
+
+        threads.append({
+            'title': title,
+            'href': href,
+            'member_href': member_href,
+            'member_name': member_name,
+            'date_thread': date_thread,
+            'tags': tags_thread,
+            'answers' : answers,
+            'visits' : visits,
+            'last_post' : last_post,
+            'is_fixed' : is_fixed,
+        })
+
+    return {'threads': threads, 'total_pages': total_pages, 'next': next_url}
+
+def extract_page_nav_lexbor(tree, base_url):
+    try:
+        total_pages = int(tree.css_first("ul.pageNav-main").css('li')[-1].text())
+    except:
+        total_pages = 1
+
+    next_url = None
+    next_el = tree.css_first("a.pageNav-jump--next")
+    if next_el!=None:
+        next_url = urllib.parse.urljoin(base_url, next_el.attributes['href'])
+
+    return total_pages, next_url
+
+def attribute(node, name): # raise as bs4 does when the attribute is missing
+    value = node.attributes.get(name)
+    if value==None:
+        raise KeyError(name)
+    return value
+
+def extract_posts_lexbor(tree, base_url): # same result of extract_posts using a selectolax tree
+    total_pages, next_url = extract_page_nav_lexbor(tree, base_url)
+
+    posts = []
+    for message in tree.css('article.message--post'):
+
+        official_id = attribute(message, 'data-content')
+
+        try:
+            user = message.css_first('div.message-cell--user').css_first('a.username')
+            user_name = user.text()
+            user_href = attribute(user, 'href')
+        except:
+            user_name = ''
+            user_href = ''
+
+        main = message.css_first('div.message-cell--main')
+        creation_time = attribute(main.css_first('header').css_first('time'), 'datetime')
+
+        posts.append({
+            'official_id': official_id,
+            'user_name': user_name,
+            'user_href': user_href,
+            'creation': creation_time,
+            'message': main.css_first('article.message-body').css_first('div.bbWrapper').html,
+        })
+
+    return {'posts': posts, 'total_pages': total_pages, 'next': next_url}
+
+def extract_threads_lexbor(tree, base_url): # same result of extract_threads using a selectolax tree
+    total_pages, next_url = extract_page_nav_lexbor(tree, base_url)
+
+    threads = []
+    for post in tree.css("div.structItem-title"):
+        item = post.parent.parent
+
+        is_fixed = "structItemContainer-group--sticky" in (item.parent.attributes.get('class') or "").split()
+        user_el = post.parent.css_first('div.structItem-minor').css_first('li').css_first('a')
+        member_href = ""
+        member_name = ""
+        try:
+            member_href = attribute(user_el, 'href')
+            member_href = urllib.parse.urljoin(base_url, member_href)
+            member_name = user_el.text()
+        except:
+            pass
+        date_thread = attribute(item.css_first('time'), 'datetime')
+
+        tags_a = post.css('a')
+
+        title = tags_a[-1].text()
+        href = urllib.parse.urljoin(base_url, attribute(tags_a[-1], 'href'))
+
+        tags_thread = list(map(lambda x: x.text() ,tags_a[0:-1]))
+
+        meta = item.css_first('div.structItem-cell--meta').css("dl")
+        answers = meta[0].css("dd")[0].text()
+        visits = meta[1].css("dd")[0].text()
+
+        try:
+            last_post = attribute(item.css_first("div.structItem-cell--latest").css_first('time'), 'datetime')
+        except:
+            last_post = min_datetime().isoformat()
+            last_post = last_post[0:-3]+last_post[-2:]
+
+        threads.append({
+            'title': title,
+            'href': href,
+            'member_href': member_href,
+            'member_name': member_name,
+            'date_thread': date_thread,
+            'tags': tags_thread,
+            'answers' : answers,
+            'visits' : visits,
+            'last_post' : last_post,
+            'is_fixed' : is_fixed,
+        })
+
+    return {'threads': threads, 'total_pages': total_pages, 'next': next_url}
+
+def has_class(*names): # SoupStrainer class filter. bs4 may give the raw attribute, a list or a single class
+    names = set(names)
+    def match(value):
+        if value==None:
+            return False
+        if not isinstance(value, str):
+            value = " ".join(value)
+        return any(c in names for c in value.split())
+    return match
+
+EXTRACTORS = {
+    'posts': extract_posts,
+    'threads': extract_threads,
+}
+
+EXTRACTORS_LEXBOR = {
+    'posts': extract_posts_lexbor,
+    'threads': extract_threads_lexbor,
+}
+
+STRAINERS = { # only the subtrees read by each extractor are built
+    'posts': SoupStrainer(["article", "ul", "a"], class_=has_class("message--post", "pageNav-main", "pageNav-jump--next")),
+    'threads': SoupStrainer(["div", "ul", "a"], class_=has_class("structItemContainer", "pageNav-main", "pageNav-jump--next")),
+}
+
+def parse_page(kind, content, base_url, backend="html.parser"): # html text -> extracted page
+    if backend=="lexbor":
+        from selectolax.lexbor import LexborHTMLParser # selectolax is only required by this backend
+        return EXTRACTORS_LEXBOR[kind](LexborHTMLParser(content), base_url)
+
+    html = BeautifulSoup(content, backend, parse_only=STRAINERS[kind])
+    return EXTRACTORS[kind](html, base_url)
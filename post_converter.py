@@ -0,0 +1,228 @@
+import re
+import threading
+from urllib.parse import urlparse
+from lxml import etree
+
+LINK = re.compile(r'(http:\/\/\S+|https:\/\/\S+)', flags=re.MULTILINE)
+SPACES = re.compile(r' +')
+HIDDEN = ("script", "style", "template") # bs4 leaves their strings out of .text
+FULL = 11 # every step applied
+
+# Steps of limpar_post (tests/reference_cleaner.py), in the order it runs them. An element replaced by a step is seen by the
+# later steps as the text that replaced it, and by the earlier ones as a plain element.
+MERGE, BR, IFRAME, CODE, SHARED, IMG, A, MEDIA, QUOTE, SPOILER = range(1, 11)
+
+
+class PostConverter: # html of a message -> text with the Cleaner tags, in a single walk of one lxml tree
+    # Output is the same of limpar_post (compare them with python benchmark.py clean). limpar_post
+    # runs one find_all per step and parses quotes and spoilers again. Here each element is replaced when the
+    # walk reaches it, using the text its content had when limpar_post replaced it. Markup dropped by a
+    # replacement is still walked when it may fail, so malformed posts raise as they do in limpar_post.
+
+    def __init__(self, tags):
+        self.tags = tags
+        self.parsers = threading.local() # lxml parsers must not be shared by threads
+
+    def parse(self, html): # root element, or None for an empty message
+        parser = getattr(self.parsers, 'parser', None)
+        if parser==None:
+            parser = etree.HTMLParser()
+            self.parsers.parser = parser
+        return etree.fromstring(html, parser)
+
+    def convert(self, html):
+        root = self.parse(html)
+        if root is None:
+            return ""
+        return self.normalize(self.text(root, FULL))
+
+    def extract(self, html): # (text, quoted posts) from a single parse
+        root = self.parse(html)
+        if root is None:
+            return "", []
+        return self.normalize(self.text(root, FULL)), self.quote_targets(root)
+
+    def quote_targets(self, root): # data-content-selector of the quoted posts, as identify_conversations
+        # When the message has a quote, the link of every quote title counts, even titles outside quotes.
+        targets = set()
+        for quote in root.iter("blockquote"):
+            if has_class(quote, "bbCodeBlock--quote"):
+                for title in root.iter("div"):
+                    if has_class(title, "bbCodeBlock-title"):
+                        a = next(title.iter("a"), None)
+                        if a!=None and "data-content-selector" in a.attrib:
+                            targets.add(a.attrib["data-content-selector"])
+                break
+        return sorted(targets)
+
+    def normalize(self, res): # as the end of limpar_post
+        res = res.strip()
+        res = res.replace("\n", " ")
+        res = res.replace("\r", " ")
+        res = res.replace("\t", " ")
+        res = SPACES.sub(' ', res)
+        res = res.replace(u"\u200b", ' ')
+        return res.replace(u'\xa0', ' ')
+
+    def to_single_line(self, s):
+        return s.replace("\r", " ").replace("\n", " ")
+
+    def step(self, el, limit): # step replacing el when the steps before limit were applied, or None
+        tag = el.tag
+        if tag=="div":
+            classes = el.get("class")
+            if classes==None:
+                return None
+            classes = classes.split()
+            if "kl_amdp_merge_message" in classes:
+                return MERGE
+            if "bbCodeBlock--code" in classes:
+                return CODE if CODE<limit else None
+            if "bbCodeBlock" in classes and SHARED<limit and self.is_shared(el):
+                return SHARED
+            if "bbCodeSpoiler" in classes:
+                return SPOILER if SPOILER<limit else None
+            return None
+        if tag=="br":
+            return BR
+        if tag=="iframe":
+            return IFRAME if IFRAME<limit else None
+        if tag=="img":
+            return IMG if IMG<limit else None
+        if tag=="a":
+            return A if A<limit else None
+        if tag=="span":
+            return MEDIA if MEDIA<limit and "data-s9e-mediaembed" in el.attrib else None
+        if tag=="blockquote":
+            return QUOTE if QUOTE<limit else None
+        return None
+
+    def is_shared(self, el): # bbCodeBlock replaced by shared_content
+        return "data-host" in el.attrib and self.find(el, lambda x: x.tag=="a", SHARED)!=None
+
+    def descendants(self, el, limit, skip_quotes=False): # elements still in the tree at limit, in document order
+        for child in el:
+            if not isinstance(child.tag, str): # comment or processing instruction
+                continue
+            if self.step(child, limit)!=None or (skip_quotes and child.tag=="blockquote"):
+                continue
+            yield child
+            yield from self.descendants(child, limit, skip_quotes)
+
+    def find(self, el, match, limit, skip_quotes=False): # first descendant still in the tree at limit
+        for x in self.descendants(el, limit, skip_quotes):
+            if match(x):
+                return x
+        return None
+
+    def text(self, el, limit, hidden=False): # text of the content of el with the steps before limit applied
+        out = []
+        self.walk(el, limit, hidden, out)
+        return "".join(out)
+
+    def walk(self, el, limit, hidden, out):
+        if el.text and not hidden:
+            out.append(el.text)
+        for child in el:
+            if isinstance(child.tag, str):
+                step = self.step(child, limit)
+                if step!=None:
+                    out.append(self.replace(child, step, hidden))
+                else:
+                    self.walk(child, limit, hidden or child.tag in HIDDEN, out)
+            if child.tail and not hidden:
+                out.append(child.tail)
+
+    def is_hidden(self, x, el, hidden): # strings of x, a descendant of el, are left out of .text
+        x = x.getparent()
+        while not hidden and x is not el:
+            hidden = x.tag in HIDDEN
+            x = x.getparent()
+        return hidden
+
+    def may_fail(self, el): # el has content that makes limpar_post raise when malformed
+        for x in el.iter("iframe", "img", "blockquote", "div"):
+            if x.tag!="div" or is_code_block(x):
+                return True
+        return False
+
+    def check(self, el, limit, hidden): # dropped content. Raises as limpar_post would
+        if self.may_fail(el):
+            self.text(el, limit, hidden)
+
+    def replace(self, el, step, hidden): # text replacing el
+        if step==MERGE or step==BR:
+            return ""
+
+        if step==IFRAME:
+            for x in self.descendants(el, IFRAME): # limpar_post also replaces iframes it already dropped
+                if x.tag=="iframe":
+                    urlparse(x.attrib['src'])
+            return self.tags['iframe'].format(urlparse(el.attrib['src']).netloc)
+
+        if step==CODE:
+            self.check(el, CODE, hidden)
+            for x in self.descendants(el, CODE): # limpar_post also replaces code blocks it already dropped
+                if is_code_block(x) and self.find(x, is_code, CODE)==None:
+                    raise AttributeError("Code block without code")
+            code = self.find(el, is_code, CODE)
+            if code==None:
+                raise AttributeError("Code block without code")
+            return self.tags['code'].format(self.to_single_line(self.text(code, CODE, self.is_hidden(code, el, hidden))))
+
+        if step==SHARED:
+            self.check(el, SHARED, hidden)
+            a = self.find(el, lambda x: x.tag=="a", SHARED)
+            return self.tags['shared_content'].format(el.attrib['data-host'], self.text(a, SHARED, self.is_hidden(a, el, hidden)))
+
+        if step==IMG:
+            classes = el.get("class")
+            if classes==None:
+                return self.tags['img_unknown']
+            classes = classes.split()
+            if 'bbImage' in classes:
+                return self.tags['external_image']
+            if 'smilie' in classes:
+                return self.tags['emoji'].format(el.attrib['alt'])
+            return self.tags['img_unknown']
+
+        if step==A:
+            text = self.text(el, A, hidden)
+            try:
+                domain = urlparse(el.attrib['href']).netloc
+                text = LINK.sub(self.tags['link'], text)
+                return self.tags['url'].format(domain, text)
+            except:
+                return ""
+
+        if step==MEDIA:
+            self.check(el, MEDIA, hidden)
+            return self.tags['mediaembed'].format(el.attrib['data-s9e-mediaembed'])
+
+        if step==QUOTE: # inner quotes are replaced first
+            self.check(el, SPOILER, hidden)
+            if self.find(el, is_title, QUOTE, True)!=None: # quotes of posts are removed
+                return ""
+            content = self.find(el, is_content, QUOTE, True)
+            if content==None:
+                raise AttributeError("Quote without content")
+            return self.tags['quote'].format(self.normalize(self.text(content, FULL, self.is_hidden(content, el, hidden))))
+
+        if step==SPOILER:
+            return self.tags['spoiler'].format(self.normalize(self.text(el, FULL, hidden)))
+
+
+def has_class(el, name):
+    return name in (el.get("class") or "").split()
+
+def is_code_block(el):
+    return el.tag=="div" and has_class(el, "bbCodeBlock--code")
+
+def is_code(el):
+    return el.tag=="code"
+
+def is_title(el):
+    return el.tag=="div" and has_class(el, "bbCodeBlock-title")
+
+def is_content(el):
+    return el.tag=="div" and has_class(el, "bbCodeBlock-content")
@@ -0,0 +1,103 @@
+import email.utils
+import logging
+import random
+import threading
+import time
+from urllib.parse import urlparse
+
+THROTTLE_STATUS = [429, 503] # the site asks us to slow down. Every worker cools down
+RETRY_STATUS = [429, 500, 502, 503, 504, 520, 521, 522, 524]
+
+BACKOFF_BASE = { # first delay in seconds, doubled every attempt
+    429: 30,
+    503: 15,
+    None: 5, # connection errors, timeouts and other server errors
+}
+
+
+class RetryableHTTPError(Exception):
+
+    def __init__(self, url, status, retry_after=None):
+        super().__init__("HTTP {} for {}".format(status, url))
+        self.status = status
+        self.retry_after = retry_after # raw Retry-After header
+
+
+def parse_retry_after(value): # seconds or HTTP date -> seconds, None when missing/invalid
+    if value==None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp()-time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+
+    def __init__(self, rate, burst):
+        self.rate = rate # tokens per second
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def reserve(self): # take one token, returns how long the caller must wait for it
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens+(now-self.updated)*self.rate)
+        self.updated = now
+        self.tokens -= 1
+        if self.tokens>=0:
+            return 0.0
+        return -self.tokens/self.rate
+
+
+class RateLimiter: # shared by every worker. One bucket and one cool down per host
+
+    def __init__(self, rate=None, burst=1, max_backoff=600):
+        self.rate = rate # requests per second per host. None disables the bucket
+        self.burst = max(1, burst)
+        self.max_backoff = max_backoff
+
+        self.buckets = {}
+        self.cooldown_until = {}
+
+        # locks
+        self.lock = threading.Lock()
+
+    def reserve(self, url): # seconds to wait before sending a request to the host of url
+        host = urlparse(url).netloc
+        with self.lock:
+            wait = max(0.0, self.cooldown_until.get(host, 0)-time.monotonic())
+            if self.rate!=None:
+                bucket = self.buckets.get(host)
+                if bucket==None:
+                    bucket = TokenBucket(self.rate, self.burst)
+                    self.buckets[host] = bucket
+                wait = max(wait, bucket.reserve())
+        return wait
+
+    def acquire(self, url):
+        wait = self.reserve(url)
+        if wait>0:
+            time.sleep(wait)
+
+    def backoff(self, url, attempt, status=None, retry_after=None): # seconds to wait before the next attempt
+        delay = parse_retry_after(retry_after)
+        if delay==None:
+            base = BACKOFF_BASE.get(status, BACKOFF_BASE[None])
+            delay = base*(2**(attempt-1))
+            delay = delay*random.uniform(0.5, 1.5) # jitter so workers do not retry together
+        delay = min(delay, self.max_backoff)
+
+        if status in THROTTLE_STATUS:
+            host = urlparse(url).netloc
+            with self.lock:
+                until = time.monotonic()+delay
+                if until>self.cooldown_until.get(host, 0):
+                    self.cooldown_until[host] = until
+                    logging.warning("Cooling down {} for {:.1f}s after HTTP {}".format(host, delay, status))
+
+        return delay
@@ -0,0 +1,125 @@
+import logging
+import queue
+import threading
+import time
+import traceback
+
+
+class Scheduler: # fixed pool of long-lived workers pulling tasks from a bounded queue
+
+    def __init__(self, workers, name="scheduler", queue_size=None, report_every=30, metrics=None):
+        self.workers = workers
+        self.name = name
+        self.report_every = report_every # seconds between progress logs
+        self.metrics = metrics # queue_depth gauge, when given
+
+        if queue_size==None:
+            queue_size = workers*2
+        self.tasks = queue.Queue(maxsize=queue_size) # submit blocks while full (backpressure)
+
+        self.threads = []
+        self.errors = [] # (func name, args, traceback) of every failed task
+        self.total_done = 0
+        self.interrupted = False
+        self.started_at = None
+        self.last_report = None
+
+        # locks
+        self.lock_counters = threading.Lock()
+
+    def start(self):
+        self.started_at = time.time()
+        self.last_report = self.started_at
+        for i in range(self.workers):
+            x = threading.Thread(target=self.worker, name="{}-{}".format(self.name, i), daemon=True)
+            self.threads.append(x)
+            x.start()
+
+    def worker(self):
+        while True:
+            task = self.tasks.get()
+            if task==None: # sentinel sent by close
+                break
+            self.record_queue()
+
+            func, args = task
+            try:
+                func(*args)
+            except Exception as e:
+                logging.error("EXCEPTION {} task {}{}: {}".format(self.name, func.__name__, str(args), traceback.format_exc().replace("\n","")))
+                with self.lock_counters:
+                    self.errors.append((func.__name__, args, traceback.format_exc()))
+
+            self.task_done()
+
+    def task_done(self):
+        with self.lock_counters:
+            self.total_done += 1
+            now = time.time()
+            if now-self.last_report<self.report_every:
+                return
+            self.last_report = now
+        self.report()
+
+    def rate(self):
+        elapsed = max(time.time()-self.started_at, 1e-9)
+        return self.total_done/elapsed
+
+    def report(self):
+        logging.info("{}: {} tasks done, {:.2f} tasks/s, {} errors, {} queued".format(self.name, self.total_done, self.rate(), len(self.errors), self.tasks.qsize()))
+
+    def submit(self, func, *args):
+        self.tasks.put((func, args))
+        self.record_queue()
+
+    def record_queue(self):
+        if self.metrics!=None:
+            self.metrics.set('queue_depth', self.tasks.qsize(), scheduler=self.name)
+
+    def discard_pending(self): # tasks not started yet are dropped
+        discarded = 0
+        while True:
+            try:
+                self.tasks.get_nowait()
+                discarded += 1
+            except queue.Empty:
+                break
+        return discarded
+
+    def interrupt(self):
+        self.interrupted = True
+        discarded = self.discard_pending()
+        logging.warning("{}: interrupted. {} queued tasks discarded, waiting for running tasks".format(self.name, discarded))
+        print("\nInterrupted. Waiting for running tasks to finish...")
+
+    def close(self):
+        for i in range(len(self.threads)):
+            while True:
+                try:
+                    self.tasks.put(None)
+                    break
+                except KeyboardInterrupt:
+                    self.interrupt()
+
+        for x in self.threads:
+            while x.is_alive():
+                try:
+                    x.join(1)
+                except KeyboardInterrupt:
+                    self.interrupt()
+
+        self.record_queue()
+        self.report()
+
+    def run(self, tasks): # tasks is an iterable of (func, args). Ctrl-C drains the pool and is raised again
+        self.start()
+        try:
+            for func, args in tasks:
+                self.submit(func, *args)
+        except KeyboardInterrupt:
+            self.interrupt()
+
+        self.close()
+
+        if self.interrupted:
+            raise KeyboardInterrupt()
@@ -0,0 +1,279 @@
+import argparse
+import json
+import os
+import threading
+from datetime import datetime
+from urllib.parse import urlparse
+
+try:
+    import orjson
+except ImportError: # only required by the orjson format
+    orjson = None
+
+try:
+    import msgpack
+    import zstandard
+except ImportError: # only required by the msgpack format
+    msgpack = None
+    zstandard = None
+
+FORMATS = ["json", "json-compact", "orjson", "msgpack"] # msgpack files are compressed with zstd
+
+
+def default(o): # to save custom format
+    if type(o) is datetime:
+        return o.isoformat()
+
+
+class JsonFormat: # indented json, as written by the first versions
+    name = "json"
+    document_ext = ".json"
+    records_ext = ".jsonl" # one record per line
+
+    def dumps(self, obj):
+        return json.dumps(obj, indent=2, default=default).encode("utf-8")
+
+    def loads(self, data):
+        return json.loads(data)
+
+    def dumps_record(self, obj):
+        return json.dumps(obj, default=default).encode("utf-8")
+
+    def dumps_records(self, records):
+        return b"".join(self.dumps_record(r)+b"\n" for r in records)
+
+    def loads_records(self, data): # (records, amount of malformed records)
+        records = []
+        malformed = 0
+        for line in data.split(b"\n"):
+            if line.strip()==b"":
+                continue
+            try:
+                records.append(self.loads(line))
+            except ValueError: # line cut by a crash while appending
+                malformed += 1
+        return records, malformed
+
+    def append(self, file, records):
+        with open(file, "ab+") as f:
+            f.seek(0, os.SEEK_END)
+            if f.tell()>0:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1)!=b"\n": # a crash left half a line. Keep it on its own line
+                    f.write(b"\n")
+            f.write(self.dumps_records(records))
+
+
+class CompactJsonFormat(JsonFormat): # json without indentation
+
+    name = "json-compact"
+
+    def dumps(self, obj):
+        return json.dumps(obj, separators=(",", ":"), default=default).encode("utf-8")
+
+
+class OrjsonFormat(JsonFormat): # compact json written and read by orjson
+
+    name = "orjson"
+
+    def __init__(self):
+        if orjson==None:
+            raise Exception("The orjson format requires orjson (pip install orjson)")
+
+    def dumps(self, obj):
+        return orjson.dumps(obj, default=default, option=orjson.OPT_NON_STR_KEYS)
+
+    def loads(self, data):
+        return orjson.loads(data)
+
+    def dumps_record(self, obj):
+        return orjson.dumps(obj, default=default, option=orjson.OPT_NON_STR_KEYS)
+
+
+class MsgpackFormat: # msgpack compressed with zstd. Each append is a new zstd frame
+
+    name = "msgpack"
+    document_ext = ".mpk.zst"
+    records_ext = ".mpkl.zst"
+
+    def __init__(self):
+        if msgpack==None:
+            raise Exception("The msgpack format requires msgpack and zstandard (pip install msgpack zstandard)")
+
+    def dumps(self, obj):
+        return zstandard.ZstdCompressor(level=3).compress(msgpack.packb(obj, default=default, use_bin_type=True))
+
+    def loads(self, data):
+        return msgpack.unpackb(zstandard.ZstdDecompressor().decompress(data), raw=False, strict_map_key=False)
+
+    def dumps_records(self, records):
+        return zstandard.ZstdCompressor(level=3).compress(b"".join(msgpack.packb(r, default=default, use_bin_type=True) for r in records))
+
+    def loads_records(self, data):
+        unpacker = msgpack.Unpacker(raw=False, strict_map_key=False)
+        malformed = 0
+        while len(data)>0: # one frame per append
+            frame = zstandard.ZstdDecompressor().decompressobj()
+            try:
+                unpacker.feed(frame.decompress(data))
+            except zstandard.ZstdError:
+                malformed += 1
+                break
+            if not frame.eof: # frame cut by a crash while appending
+                malformed += 1
+                break
+            data = frame.unused_data
+
+        records = []
+        try:
+            for r in unpacker:
+                records.append(r)
+        except Exception: # record cut by a crash
+            malformed += 1
+        return records, malformed
+
+    def append(self, file, records):
+        with open(file, "ab") as f:
+            f.write(self.dumps_records(records))
+
+
+FORMAT_CLASSES = {
+    'json': JsonFormat,
+    'json-compact': CompactJsonFormat,
+    'orjson': OrjsonFormat,
+    'msgpack': MsgpackFormat,
+}
+
+
+class Serializer: # documents (category files, thread information) and records (thread messages) in the selected format
+    # Files are named <base><extension>. Readers accept every format, so a folder may mix formats while
+    # it is converted. Writers use the selected format and remove the file of the same base in other formats.
+    # With name None, files are rewritten in the format they already have (json for new files).
+
+    def __init__(self, name="json"):
+        self.keep = name==None
+        if self.keep:
+            name = "json"
+        if not name in FORMAT_CLASSES:
+            raise Exception("Invalid serializer format: {}".format(name))
+        self.format = FORMAT_CLASSES[name]()
+        self.name = name
+
+    def readers(self): # selected format first. The json formats share the same files
+        formats = [self.format]
+        for cls in [JsonFormat, MsgpackFormat]:
+            if not isinstance(self.format, cls) and (cls!=MsgpackFormat or msgpack!=None):
+                formats.append(cls())
+        return formats
+
+    def find(self, base, records=False): # (file, format) of an existing file, or (None, None)
+        for fmt in self.readers():
+            file = base+(fmt.records_ext if records else fmt.document_ext)
+            if os.path.isfile(file):
+                return file, fmt
+        return None, None
+
+    def base_name(self, file_name): # file name without the extension of a document, or None
+        for cls in FORMAT_CLASSES.values():
+            if file_name.endswith(cls.document_ext):
+                return file_name[0:-len(cls.document_ext)]
+        return None
+
+    def document_file(self, base):
+        return base+self.format.document_ext
+
+    def exists(self, base):
+        return self.find(base)[0]!=None
+
+    def read(self, base):
+        file, fmt = self.find(base)
+        if file==None:
+            raise FileNotFoundError(base)
+        with open(file, "rb") as f:
+            return fmt.loads(f.read())
+
+    def writer(self, base, records=False): # format used to write base
+        if self.keep:
+            file, fmt = self.find(base, records)
+            if fmt!=None:
+                return fmt
+        return self.format
+
+    def write(self, base, obj):
+        fmt = self.writer(base)
+        write_atomic(base+fmt.document_ext, fmt.dumps(obj))
+        self.remove_others(base, fmt.document_ext, False)
+
+    def records_file(self, base): # existing records file, or None
+        return self.find(base, True)[0]
+
+    def read_records(self, base): # (records, amount of malformed records)
+        file, fmt = self.find(base, True)
+        if file==None:
+            return [], 0
+        with open(file, "rb") as f:
+            return fmt.loads_records(f.read())
+
+    def write_records(self, base, records):
+        fmt = self.writer(base, True)
+        write_atomic(base+fmt.records_ext, fmt.dumps_records(records))
+        self.remove_others(base, fmt.records_ext, True)
+
+    def append_records(self, base, records): # to the existing file, in its format
+        file, fmt = self.find(base, True)
+        if file==None:
+            file, fmt = base+self.format.records_ext, self.format
+        fmt.append(file, records)
+
+    def remove_others(self, base, written_ext, records): # files of base in other formats
+        for cls in FORMAT_CLASSES.values():
+            ext = cls.records_ext if records else cls.document_ext
+            if ext!=written_ext and os.path.isfile(base+ext):
+                os.remove(base+ext)
+
+
+def write_atomic(file, data): # bytes or str. Readers see the old or the new file, never half of it
+    tmp = "{}.{}.tmp".format(file, threading.get_ident())
+    with open(tmp, "wb" if type(data) is bytes else "w") as f:
+        f.write(data)
+    os.replace(tmp, file)
+
+
+def main(url, name): # compact the thread files and convert them and the category files to the format name. None keeps the format of each file
+    from thread_store import ThreadStore
+
+    domain = urlparse(url).netloc
+    config_folder = "./config/{}/".format(domain)
+    if not os.path.exists(config_folder):
+        raise Exception("Config folder not found: {}".format(config_folder))
+
+    serializer = Serializer(name)
+
+    folder_cat = config_folder+"categories_threads/"
+    files = []
+    if name!=None and os.path.exists(folder_cat): # category files have nothing to compact
+        files = os.listdir(folder_cat)
+    for i in range(len(files)):
+        base = serializer.base_name(files[i])
+        if base==None:
+            continue
+        serializer.write(folder_cat+base, serializer.read(folder_cat+base))
+        print("category file {}\t{}/{}".format(base, i+1, len(files)))
+
+    store = ThreadStore(config_folder+"threads/", serializer)
+    ids = store.list_ids()
+    for i in range(len(ids)):
+        total = store.compact(ids[i])
+        print("id={}\t{}/{}\tmessages: {}".format(ids[i], i+1, len(ids), total))
+
+
+if __name__ == "__main__":
+
+    ap = argparse.ArgumentParser()
+
+    ap.add_argument("-url", required=True, type=str, help="The base URL of the forum using XenForo")
+    ap.add_argument("-f", "--format", required=False, default=None, choices=FORMATS, help="Convert the category and thread files to this format. By default the threads are only compacted and each file keeps its format")
+
+    args = vars(ap.parse_args())
+
+    main(args['url'], args['format'])
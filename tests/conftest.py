@@ -0,0 +1,20 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..")) # modules are at the root of the repository
+
+
+@pytest.fixture(scope="session")
+def cleaner(tmp_path_factory): # Cleaner of an empty forum, in a temporary folder
+    from cleaner import Cleaner
+
+    folder = tmp_path_factory.mktemp("cleaner")
+    os.makedirs(folder/"config"/"forum.test"/"threads")
+    cwd = os.getcwd()
+    os.chdir(folder)
+    try:
+        yield Cleaner("https://forum.test", 0, float('inf'), True, False, 1, False)
+    finally:
+        os.chdir(cwd)
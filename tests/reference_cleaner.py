@@ -0,0 +1,215 @@
+import re
+from urllib.parse import urlparse
+
+from bs4 import BeautifulSoup
+
+
+class ReferenceCleaner: # methods of the original cleaner.Cleaner, replaced by post_converter.py
+    # Kept unchanged as the expected output: python -m pytest tests compares them on tests/fixtures and
+    # python benchmark.py clean on the mined messages. mount_conversation, below, is the reference of
+    # conversations.py, compared by tests/test_conversations.py and python benchmark.py conversations.
+
+    def __init__(self, tags):
+        self.tags = tags # of Cleaner.create_configs
+
+    def limpar_post(self, post_bs):
+        if type(post_bs)==str:
+            post_bs = BeautifulSoup(post_bs, features="lxml")
+
+        for el in post_bs.find_all('div', class_="kl_amdp_merge_message"): # remove mensagem de post duplo
+            el.extract()
+
+            
+        for el in post_bs.find_all('br'): # remove mensagem de post duplo
+            el.extract()
+
+        iframes = post_bs.find_all('iframe')
+        for iframe in iframes: # detecta iframes
+            domain = urlparse(iframe['src']).netloc
+            insert = self.tags['iframe'].format(domain)
+            iframe.insert_after(insert)
+            iframe.extract()
+
+
+        bbcodeblockscode = post_bs.find_all('div', class_="bbCodeBlock--code")
+        for bbcodeblockcode in bbcodeblockscode: # detecta codes
+            insert = self.tags['code'].format(self.to_single_line(bbcodeblockcode.find('code').text))
+            bbcodeblockcode.insert_after(insert)
+            bbcodeblockcode.extract()
+
+
+        bbcodeblocks = post_bs.find_all('div', class_="bbCodeBlock")
+        for bbcodeblock in bbcodeblocks: # detecta shared contents
+            ok = False
+            try:
+                data_host = bbcodeblock['data-host']
+
+                title = bbcodeblock.find_all('a')[0].getText()
+                ok = True
+            except:
+                pass
+
+            if ok:
+                insert = self.tags['shared_content'].format(data_host, title)
+
+                bbcodeblock.insert_after(insert)
+
+                bbcodeblock.extract()
+
+        for img in post_bs.find_all('img'): # detecta images
+            overwrite_with = ""
+            if img.has_attr('class'):
+                if 'bbImage' in img['class']:
+                    overwrite_with = self.tags['external_image']
+                elif 'smilie' in img['class']:
+                    overwrite_with = self.tags['emoji'].format(img['alt'])
+                else:
+                    overwrite_with = self.tags['img_unknown']
+            else:
+                overwrite_with = self.tags['img_unknown']
+
+            img.insert_after(overwrite_with)
+            img.unwrap()
+
+        for a in post_bs.find_all('a'): # detecta links
+
+            try:
+                text = a.getText()
+                domain = urlparse(a['href']).netloc
+                text = re.sub('(http:\/\/\S+|https:\/\/\S+)', self.tags['link'], text, flags=re.MULTILINE)
+                insert = self.tags['url'].format(domain, text)
+                a.insert_after(insert)
+            except:
+                pass
+
+            a.extract()
+
+        for span in post_bs.find_all('span'): # detect videos
+            try:
+                source = span['data-s9e-mediaembed']
+
+                insert = self.tags['mediaembed'].format(source)
+
+                span.insert_after(insert)
+
+                span.extract()
+            except:
+                pass
+
+        quotes = post_bs.find_all('blockquote') # remove quotes
+        quotes = quotes[::-1]
+        for quote in quotes:
+            title = quote.find('div', class_="bbCodeBlock-title")
+            content = quote.find('div', class_="bbCodeBlock-content")
+            if title==None:
+                insert = self.tags['quote'].format(self.limpar_post(content))
+
+                quote.insert_after(insert)
+            quote.extract() # THIS WILL REMOVE ALL QUOTES AFTER IDENTIFIED
+
+        spoilers = post_bs.find_all('div', class_='bbCodeSpoiler')
+        spoilers = spoilers[::-1]
+        for spoiler in spoilers:
+            insert = self.tags['spoiler'].format(self.limpar_post(spoiler))
+            spoiler.insert_after(insert)
+            spoiler.extract()
+
+        res = post_bs.text
+        res = res.strip()
+        res = res.replace("\n", " ")
+        res = res.replace("\r", " ")
+        res = res.replace("\t", " ")
+        res = re.sub(r' +', ' ', res)
+        res = re.sub(u"\u200b", ' ', res)
+        res = re.sub(u'\xa0', ' ', res)
+        return res
+
+    def to_single_line(self, s):
+        s = s.replace("\r", " ")
+        return s.replace("\n", " ")
+
+    def identify_conversations(self, msg): # the original also kept the result by thread and message id
+        msg = BeautifulSoup(msg, features="lxml")
+
+        quotes = msg.find_all("blockquote", class_="bbCodeBlock--quote")
+        res = []
+
+        for quote in quotes:
+            title = msg.find_all("div", class_="bbCodeBlock-title")
+            for t in title:
+                if t.a!=None:
+                    try:
+                        res.append(t.a['data-content-selector'])
+                    except:
+                        pass
+
+        res = list(set(res))
+        res.sort()
+
+        return res
+
+
+def mount_conversation(orig, dat, index_message, res_final): # conversations of the thread that start on orig, recursively. Replaced by conversations.ReplyGraph
+    # Unchanged but for the quoted posts: the original parsed them with self.identify_conversations(orig['message'], thread_id, orig['official_id']).
+    # They are the quote_targets given by PostConverter, the same list (see tests/test_post_converter.py).
+    try:
+        index_message["#"+orig['official_id']]
+    except:
+        return res_final
+
+    cs = orig['quote_targets']
+
+    try:
+        orig['parent']
+    except:
+        orig['parent'] = None
+    
+    for c in cs:
+        
+        check_repeated = orig
+        can_continue = True
+        while check_repeated!=None:
+            if c=="#"+check_repeated['official_id']:
+                can_continue = False
+                break
+            check_repeated = check_repeated['parent']
+        
+        if can_continue:
+            try:
+                idx = index_message[c]
+                next_message = dat['messages'][idx]
+            except:
+                continue
+            if next_message['isodate']<orig['isodate']: # avoid timetravel response
+                next_message['parent'] = orig
+                res_final = mount_conversation(next_message, dat, index_message, res_final)
+
+    if len(cs)==0:
+        r = []
+        while orig['parent']!=None:
+            idx = index_message["#"+orig['official_id']]
+            r.append(dat['messages'][idx])
+            orig = orig['parent']
+
+        idx = index_message["#"+orig['official_id']]
+        r.append(dat['messages'][idx])
+
+        if len(r)>1:
+            res_final.append(r)
+
+    return res_final
+
+def reference_conversations(messages): # conversations of mount_conversation, as the loop clean_thread had
+    dat = {'messages': messages}
+    index_message = {}
+    for i in range(len(messages)):
+        index_message["#{}".format(messages[i]['official_id'])] = i
+
+    res = []
+    for i in range(len(messages)-1, -1, -1):
+        convs = mount_conversation(messages[i], dat, index_message, [])
+        res.extend(convs)
+        for conv in convs:
+            for m in conv:
+                index_message.pop("#"+m['official_id'], None)
+    return res
@@ -0,0 +1,90 @@
+import datetime
+import random
+
+import pytest
+
+from benchmark import make_thread
+from conversations import ReplyGraph
+from tests.reference_cleaner import reference_conversations
+
+
+def thread(specs): # (official_id, quote_targets) in the order of the thread, one minute apart
+    return [{'official_id': name, 'isodate': datetime.datetime(2021, 1, 1)+datetime.timedelta(minutes=i), 'quote_targets': targets} for i, (name, targets) in enumerate(specs)]
+
+def ids(conversations):
+    return [[m['official_id'] for m in c] for c in conversations]
+
+def capped_reference(messages, max_depth): # mount_conversation with the cut of max_depth, without remembering dead posts
+    position = {"#"+messages[i]['official_id']: i for i in range(len(messages))}
+    alive = [True]*len(messages)
+    res = []
+
+    def visit(path, found):
+        node = messages[path[-1]]
+        for t in node['quote_targets']:
+            j = position.get(t)
+            if j==None or not alive[j] or not messages[j]['isodate']<node['isodate']:
+                continue
+            if len(messages[j]['quote_targets'])==0 or (max_depth!=None and len(path)+1>=max_depth):
+                found.append(path+[j])
+            else:
+                visit(path+[j], found)
+
+    for root in range(len(messages)-1, -1, -1):
+        if not alive[root]:
+            continue
+        found = []
+        visit([root], found)
+        for path in found:
+            res.append([messages[i] for i in reversed(path)])
+        for path in found:
+            for i in path:
+                alive[i] = False
+    return res
+
+# X is reached from R1 at depth 2, where it leads to no conversation, and from R2 at depth 4, where max_depth cuts there
+DEPTH_CASE = [('Y', ['#missing']), ('X', ['#Y']), ('W', ['#X']), ('Z', ['#W']), ('R2', ['#Z']), ('R1', ['#X'])]
+
+
+def test_depth_case():
+    assert ids(ReplyGraph(thread(DEPTH_CASE)).conversations(max_depth=4))==[['X', 'W', 'Z', 'R2']]
+    assert ids(ReplyGraph(thread(DEPTH_CASE[:-1])).conversations(max_depth=4))==[['X', 'W', 'Z', 'R2']]
+    assert ids(capped_reference(thread(DEPTH_CASE), 4))==[['X', 'W', 'Z', 'R2']]
+
+def test_depth_case_without_cut():
+    messages = thread(DEPTH_CASE)
+    assert ids(ReplyGraph(messages).conversations())==ids(reference_conversations(thread(DEPTH_CASE)))==[]
+
+@pytest.mark.parametrize("seed", range(40))
+def test_same_as_mount_conversation(seed):
+    rnd = random.Random(seed)
+    messages = make_thread(rnd.randint(1, 40), 0.7*rnd.random(), rnd.randint(1, 3), rnd.randint(1, 8), rnd) # small, the references take exponential time
+    for m in messages:
+        if rnd.random()<0.1: # quotes of posts outside the thread, or never leading to a post quoting nobody
+            m['quote_targets'] = sorted(m['quote_targets']+["#post-missing"])
+
+    expected = ids(reference_conversations([dict(m) for m in messages]))
+    assert ids(ReplyGraph(messages).conversations())==expected
+    assert ids(capped_reference(messages, None))==expected
+
+@pytest.mark.parametrize("seed", range(40))
+@pytest.mark.parametrize("max_depth", [2, 3, 4, 6])
+def test_max_depth(seed, max_depth):
+    rnd = random.Random(seed)
+    messages = make_thread(rnd.randint(1, 40), 0.7*rnd.random(), rnd.randint(1, 3), rnd.randint(1, 8), rnd)
+    for m in messages:
+        if rnd.random()<0.2:
+            m['quote_targets'] = sorted(m['quote_targets']+["#post-missing"])
+
+    assert ids(ReplyGraph(messages).conversations(max_depth=max_depth))==ids(capped_reference(messages, max_depth))
+
+def test_max_conversations():
+    messages = make_thread(100, 0.7, 2, 4, random.Random(1))
+    everything = ids(ReplyGraph(messages).conversations())
+    assert len(everything)>10
+    assert ids(ReplyGraph(messages).conversations(max_conversations=10))==everything[0:10]
+
+def test_long_chain(): # deeper than the recursion limit
+    messages = thread([("p0", [])]+[("p{}".format(i), ["#p{}".format(i-1)]) for i in range(1, 5000)])
+    res = ids(ReplyGraph(messages).conversations())
+    assert len(res)==1 and len(res[0])==5000
@@ -0,0 +1,89 @@
+from frontier import Frontier
+
+
+def open_frontier(file): # as Manager.create_configs without -fr
+    frontier = Frontier(file)
+    resume = frontier.has_unfinished_run()
+    if not resume:
+        frontier.discard()
+    frontier.open_run(resume)
+    return frontier, resume
+
+def tasks(phase, n):
+    return [("{}-{}".format(phase, i), {'id': i}) for i in range(n)]
+
+def run_phase(frontier, phase, resume, n, stop_after=None): # start, then ack the tasks. stop_after: tasks acked before the run is killed
+    if not frontier.start(phase, tasks(phase, n), resume):
+        return False
+    acked = 0
+    for task in frontier.leases(phase):
+        if acked==stop_after: # leased, never acked
+            return True
+        frontier.ack(task)
+        acked += 1
+    frontier.finish(phase)
+    return True
+
+
+def test_resume_is_decided_per_phase(tmp_path):
+    file = str(tmp_path/"frontier.sqlite")
+
+    # A: -rt -rp to the end
+    frontier, resume = open_frontier(file)
+    assert not resume
+    assert run_phase(frontier, "reload_threads", resume, 3)
+    assert run_phase(frontier, "reload_posts", resume, 3)
+    frontier.close()
+
+    # B: -rt killed after one subcategory
+    frontier, resume = open_frontier(file)
+    assert not resume
+    assert run_phase(frontier, "reload_threads", resume, 3, stop_after=1)
+    frontier.close()
+
+    # C: -rp. Its phase was not interrupted, so it is built again
+    frontier, resume = open_frontier(file)
+    assert resume
+    assert run_phase(frontier, "reload_posts", resume, 3)
+    assert frontier.progress("reload_posts")==(3, 3)
+    frontier.close()
+
+    # D: -rp again, with other pending threads. The phase completed by C is not the interrupted one
+    frontier, resume = open_frontier(file)
+    assert resume
+    assert frontier.start("reload_posts", tasks("reload_posts", 5), resume)
+    assert frontier.count("reload_posts", "pending")==5
+    assert frontier.count("reload_posts", "done")==0
+
+    # and -rt continues what B left
+    assert frontier.start("reload_threads", tasks("reload_threads", 3), resume)
+    assert frontier.count("reload_threads", "done")==1
+    assert frontier.count("reload_threads", "pending")==2
+    frontier.close()
+
+def test_interrupted_phase_is_resumed_once(tmp_path):
+    file = str(tmp_path/"frontier.sqlite")
+
+    frontier, resume = open_frontier(file)
+    assert run_phase(frontier, "reload_threads", resume, 3)
+    assert run_phase(frontier, "reload_posts", resume, 4, stop_after=2)
+    frontier.close()
+
+    # the completed phase of the interrupted run is skipped, the other continues
+    frontier, resume = open_frontier(file)
+    assert resume
+    assert not run_phase(frontier, "reload_threads", resume, 3)
+    assert frontier.start("reload_posts", tasks("reload_posts", 4), resume)
+    assert frontier.count("reload_posts", "done")==2
+    assert frontier.count("reload_posts", "pending")==2 # the leased task is requested again
+    for task in frontier.leases("reload_posts"):
+        frontier.ack(task)
+    assert frontier.finish("reload_posts")
+    frontier.close()
+
+    # nothing left to resume. Both phases start over
+    frontier, resume = open_frontier(file)
+    assert not resume
+    assert frontier.start("reload_threads", tasks("reload_threads", 3), resume)
+    assert frontier.count("reload_threads", "pending")==3
+    frontier.close()
@@ -0,0 +1,60 @@
+import pytest
+
+from fake_xenforo import Forum, serve, url_of
+from MinerXenForo import Manager
+
+
+@pytest.fixture
+def forum(tmp_path, monkeypatch): # two threads of 5 pages. page-3 fails while forum.failing
+    monkeypatch.chdir(tmp_path)
+    forum = Forum(categories=1, subs=1, threads=2, posts=1, posts_per_page=20)
+    for t in forum.threads.values():
+        t['posts'] = []
+        forum.add_posts(t['id'], 100, forum.start)
+
+    forum.failing = True
+    render = forum.render
+    def flaky(path):
+        if forum.failing and path.endswith("page-3"):
+            raise ConnectionError("page-3 is down") # the connection is dropped, no answer
+        return render(path)
+    forum.render = flaky
+
+    server = serve(forum)
+    forum.url = url_of(server)
+    yield forum
+    server.shutdown()
+    server.server_close()
+
+def mine(forum, engine): # reload_threads and reload_posts. (pending threads, {thread id: (messages, header)})
+    m = Manager(forum.url, 2, engine=engine, max_retries=1, metrics_interval=0)
+    try:
+        m.reload_threads()
+        m.reload_posts()
+        pending = m.catalog.count_pending()
+        rows = m.catalog.db.execute("SELECT id FROM threads WHERE "+m.catalog.pending_condition(False)).fetchall()
+        assert len(rows)==pending
+        store = m.thread_store
+        threads = {i: (len(store.read_messages(i)), store.load_header(i)) for i in store.list_ids()}
+    finally:
+        m.close()
+    return pending, threads
+
+@pytest.mark.parametrize("engine", ["thread", "async"])
+def test_partially_mined_new_threads_stay_pending(forum, engine):
+    pending, threads = mine(forum, engine)
+    assert pending==2
+    assert len(threads)==2
+    for messages, header in threads.values():
+        assert messages==40 # pages 1 and 2
+        assert header['status']=="incomplete"
+        assert not 'last_post' in header # only stored when mined to the end
+        assert not 'answers' in header
+
+    forum.failing = False
+    pending, threads = mine(forum, engine)
+    assert pending==0
+    for messages, header in threads.values():
+        assert messages==100
+        assert header['status']=="complete"
+        assert header['last_post']!=None
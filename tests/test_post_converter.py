@@ -0,0 +1,48 @@
+import json
+import os
+
+import pytest
+
+from post_converter import PostConverter
+from tests.reference_cleaner import ReferenceCleaner
+
+with open(os.path.join(os.path.dirname(__file__), "fixtures", "messages.json")) as f:
+    MESSAGES = json.load(f) # representative XenForo messages, see the names
+
+
+def reference(cleaner, message): # (text, quoted posts) of limpar_post and identify_conversations, or the exception type
+    reference_cleaner = ReferenceCleaner(cleaner.tags)
+    try:
+        return reference_cleaner.limpar_post(message), reference_cleaner.identify_conversations(message)
+    except Exception as e:
+        return type(e)
+
+def extract(converter, message):
+    try:
+        return converter.extract(message)
+    except Exception as e:
+        return type(e)
+
+
+@pytest.mark.parametrize("case", MESSAGES, ids=[m['name'] for m in MESSAGES])
+def test_same_output_as_limpar_post(cleaner, case):
+    expected = reference(cleaner, case['message'])
+    res = extract(PostConverter(cleaner.tags), case['message'])
+
+    if isinstance(expected, type): # both raise. The types differ, bs4 and lxml fail in different places
+        assert isinstance(res, type)
+    else:
+        assert res==expected
+
+def test_convert_is_the_text_of_extract(cleaner):
+    converter = PostConverter(cleaner.tags)
+    for case in MESSAGES:
+        if not case['name'].startswith("malformed"):
+            assert converter.convert(case['message'])==converter.extract(case['message'])[0]
+
+def test_fixture_covers_the_tags(cleaner): # every tag of the cleaner is produced by some message
+    converter = PostConverter(cleaner.tags)
+    texts = " ".join(converter.convert(case['message']) for case in MESSAGES if not case['name'].startswith("malformed"))
+    for name in cleaner.tags:
+        if name!="answering": # not used by limpar_post
+            assert cleaner.tags[name].split("{}")[0].strip() in texts
@@ -0,0 +1,85 @@
+import datetime
+
+import pytest
+
+import parsers
+from MinerXenForo import Manager
+
+MANAGER = Manager.__new__(Manager) # search_page_message_steps reads no attribute
+URL = "https://forum.test/threads/t.1/"
+START = datetime.datetime(2021, 1, 1)
+
+
+def page_number(url):
+    if not "page-" in url:
+        return 1
+    return int(url.split("page-")[1])
+
+def forum(total): # url -> page of a thread with 20 posts a page, one minute apart
+    pages = {}
+    for p in range(1, total+1):
+        posts = [{'creation': (START+datetime.timedelta(minutes=(p-1)*20+i)).strftime("%Y-%m-%dT%H:%M:%S-0300")} for i in range(20)]
+        pages[MANAGER.page_url(URL, p)] = {'posts': posts, 'total_pages': total}
+    return pages
+
+def limit_on(pages, p): # a date in the middle of page p
+    return parsers.parse_datetime(pages[MANAGER.page_url(URL, p)]['posts'][5]['creation'])
+
+def search(pages, guess_page, limit, failing=()): # (page found, pages requested). Pages past the end are answered with the last page, as XenForo does
+    last = pages[MANAGER.page_url(URL, len(pages))]
+    requested = []
+    steps = MANAGER.search_page_message_steps(URL, guess_page, limit)
+    try:
+        request = next(steps)
+        while True:
+            kind, url = request
+            assert kind=="posts"
+            requested.append(page_number(url))
+            if page_number(url) in failing:
+                request = steps.send(None)
+            else:
+                request = steps.send(pages.get(url, last))
+    except StopIteration as stop:
+        return stop.value, requested
+
+
+@pytest.mark.parametrize("total,limit_page,guess_page", [
+    (50, 30, 40),
+    (50, 30, 10),
+    (50, 30, 1), # nothing stored yet
+    (50, 1, 40), # limit on the first page
+    (50, 50, 40), # limit on the last page
+    (50, 50, 50),
+    (10, 7, 15), # thread shrank
+    (1, 1, 5),
+    (2, 2, 1),
+])
+def test_finds_page_of_limit(total, limit_page, guess_page):
+    pages = forum(total)
+    found, requested = search(pages, guess_page, limit_on(pages, limit_page))
+    assert found==limit_page
+    assert len(requested)==len(set(requested))
+    assert not 1 in requested # page 1 is where the mining restarts anyway
+
+def test_past_the_end_answer_is_the_last_page():
+    pages = forum(10)
+    found, requested = search(pages, 15, limit_on(pages, 10))
+    assert found==10
+    assert requested==[15] # page 10 is not requested again
+
+def test_failure_before_any_bound_keeps_stored_page():
+    pages = forum(50)
+    found, requested = search(pages, 40, limit_on(pages, 30), failing={40})
+    assert found==40
+    assert requested==[40]
+
+def test_failure_after_lower_bound_keeps_it():
+    pages = forum(50)
+    found, requested = search(pages, 10, limit_on(pages, 30), failing=set(range(31, 51)))
+    assert found==max(p for p in requested if p<=30)
+    assert found>=10
+
+def test_failure_after_past_the_end_stays_inside_the_thread():
+    pages = forum(50)
+    found, requested = search(pages, 60, limit_on(pages, 30), failing=set(range(2, 50)))
+    assert 1<=found<=50
@@ -0,0 +1,142 @@
+import json
+import logging
+import os
+import threading
+from serializer import Serializer
+
+
+class ThreadStore: # threads/<id>.json keeps the thread information, threads/<id>.jsonl its messages
+    # Messages are only appended to the .jsonl file, one message per line. Files written before this
+    # layout keep the messages inside the .json file; they are read as usual and converted on the
+    # first append or compaction. Other formats (see serializer.py) only change the extensions.
+
+    def __init__(self, folder, serializer=None):
+        self.folder = folder
+        self.serializer = serializer
+        if self.serializer==None:
+            self.serializer = Serializer()
+
+        # locks
+        self.lock_files = threading.Lock()
+        self.locks = {} # one lock per thread id
+
+    def lock(self, thread_id):
+        with self.lock_files:
+            if not thread_id in self.locks:
+                self.locks[thread_id] = threading.Lock()
+            return self.locks[thread_id]
+
+    def base(self, thread_id): # file name without extension
+        return self.folder+"{}".format(thread_id)
+
+    def list_ids(self):
+        ids = []
+        for f in os.listdir(self.folder):
+            name = self.serializer.base_name(f)
+            if name!=None:
+                ids.append(name)
+        return ids
+
+    def exists(self, thread_id):
+        return self.serializer.exists(self.base(thread_id))
+
+    def load_header(self, thread_id): # thread information without the messages
+        header = self.serializer.read(self.base(thread_id))
+        header.pop('messages', None)
+        return header
+
+    def write_header(self, thread_id, header):
+        self.convert_legacy(thread_id)
+        header = dict(header)
+        header.pop('messages', None)
+        self.serializer.write(self.base(thread_id), header)
+
+    def read_messages(self, thread_id):
+        if self.serializer.records_file(self.base(thread_id))==None: # legacy layout
+            return self.serializer.read(self.base(thread_id)).get('messages', [])
+
+        records, malformed = self.serializer.read_records(self.base(thread_id))
+        if malformed>0: # cut by a crash while appending
+            logging.warning("Malformed messages skipped in thread {}: {}".format(thread_id, malformed))
+
+        messages = []
+        seen = set()
+        for message in records:
+            if message['official_id'] in seen: # appended twice after a crash
+                continue
+            seen.add(message['official_id'])
+            messages.append(message)
+        return messages
+
+    def last_message(self, thread_id): # last stored message without reading the whole file
+        file = self.serializer.records_file(self.base(thread_id))
+        if file==None or not file.endswith(".jsonl"): # only json lines can be read from the end
+            messages = self.read_messages(thread_id)
+            if len(messages)==0:
+                return None
+            return messages[-1]
+
+        with open(file, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            end = f.tell()
+            block = 4096
+            data = b""
+            while True:
+                start = max(0, end-block)
+                f.seek(start)
+                data = f.read(end-start)
+                lines = [l for l in data.split(b"\n") if l.strip()!=b""]
+                if start>0: # the first line may be incomplete
+                    lines = lines[1:]
+                for line in lines[::-1]:
+                    try:
+                        return json.loads(line.decode("utf-8"))
+                    except ValueError:
+                        continue
+                if start==0:
+                    return None
+                block *= 4
+
+    def load(self, thread_id): # thread information with every message, as the legacy single json
+        thread = self.load_header(thread_id)
+        thread['messages'] = self.read_messages(thread_id)
+        return thread
+
+    def convert_legacy(self, thread_id): # move messages from the .json to the .jsonl
+        if self.serializer.records_file(self.base(thread_id))!=None or not self.exists(thread_id):
+            return
+        thread = self.serializer.read(self.base(thread_id))
+        messages = thread.pop('messages', [])
+        self.serializer.write_records(self.base(thread_id), messages)
+        self.serializer.write(self.base(thread_id), thread) # after the messages are safe
+
+    def create(self, thread_id, header): # new thread without messages
+        with self.lock(thread_id):
+            self.serializer.write_records(self.base(thread_id), [])
+            self.write_header(thread_id, header)
+
+    def append(self, thread_id, messages, updates): # append messages and update header fields. Returns the header
+        with self.lock(thread_id):
+            self.convert_legacy(thread_id)
+
+            if len(messages)>0:
+                self.serializer.append_records(self.base(thread_id), messages)
+
+            header = self.load_header(thread_id)
+            header.update(updates)
+            header['total_posts'] = header.get('total_posts', 0)+len(messages)
+            self.write_header(thread_id, header)
+            return header
+
+    def write(self, thread_id, thread): # replace header and messages
+        with self.lock(thread_id):
+            messages = thread.get('messages', [])
+            self.serializer.write_records(self.base(thread_id), messages)
+            header = dict(thread)
+            header['total_posts'] = len(messages)
+            self.write_header(thread_id, header)
+
+    def compact(self, thread_id): # drop duplicated and malformed lines, convert legacy files and other formats
+        thread = self.load(thread_id)
+        self.write(thread_id, thread)
+        return len(thread['messages'])